@@ -4,6 +4,81 @@ class Settings(BaseSettings):
     PROJECT_NAME: str = "E-commerce Predictive Analytics"
     DATABASE_URL: str = "sqlite:///./app.db"  # Default to SQLite for MVP
     GEMINI_API_KEY: str = ""
+    GEMINI_MODEL: str = "gemini-pro"
+
+    # Explanation generation
+    EXPLANATION_BACKEND: str = "template"  # template | fake | gemini
+    EXPLANATION_CONCURRENCY: int = 16  # requests in flight
+    EXPLANATION_RATE_LIMIT: float = 50.0  # remote backends: request starts per second (0 = unlimited)
+    EXPLANATION_FAKE_LATENCY_MS: float = 200.0  # latency of the "fake" backend
+    EXPLANATION_CACHE_SIZE: int = 50000  # memoized prompts kept per process
+
+    # Bulk writes of pipeline outputs
+    BULK_BATCH_SIZE: int = 10000
+    BULK_METHOD: str = "auto"  # auto | executemany | copy (copy is PostgreSQL only)
+
+    # Previous output generations kept readable after a pipeline run publishes
+    # a new one (pinned pagination/exports); older ones are deleted
+    GENERATIONS_RETAINED: int = 1
+
+    # RFM aggregation: order lines are streamed from the DB in chunks of this
+    # many rows and folded into per-pair aggregates (0 = load in one go)
+    RFM_CHUNK_SIZE: int = 100000
+
+    # Relative error bound of the monetary quintile cut points used for RFM
+    # scores (recency and frequency cut points are exact)
+    RFM_SKETCH_ACCURACY: float = 0.01
+
+    # POST /ingest/orders: orders written per transaction
+    INGEST_BATCH_SIZE: int = 5000
+
+    # RFM aggregation engine: "pandas" loads order lines into DataFrames;
+    # "sql" runs the whole aggregation in the database (INSERT ... SELECT)
+    RFM_ENGINE: str = "pandas"  # pandas | sql
+
+    # Where the pandas engine reads order lines from: "sql" joins the tables on
+    # every run; "snapshot" keeps memory-mapped order-fact columns in
+    # SNAPSHOT_DIR, appended with new lines before each run
+    ANALYTICS_SOURCE: str = "sql"  # sql | snapshot
+    SNAPSHOT_DIR: str = "./snapshot"
+
+    # Full rebuilds with PIPELINE_WORKERS > 1 split customers into
+    # PIPELINE_SHARDS ranges processed in parallel (0 = one shard per worker)
+    PIPELINE_WORKERS: int = 1
+    PIPELINE_SHARDS: int = 0
+
+    # Recommendation rule engine
+    RECOMMENDATION_ENGINE: str = "vectorized"  # vectorized | loop
+
+    # GET /recommendations paging
+    RECOMMENDATIONS_PAGE_SIZE: int = 500
+    RECOMMENDATIONS_MAX_PAGE_SIZE: int = 5000
+    RECOMMENDATIONS_STREAM_BATCH: int = 2000  # rows per keyset batch in NDJSON mode
+
+    # Keep the published recommendations/RFM profiles in an in-process
+    # columnar store (loaded at startup, swapped after each pipeline run)
+    SERVING_STORE: bool = True
+
+    # Read endpoint response cache, keyed by the pipeline's dataset version
+    CACHE_MAX_ENTRIES: int = 1024
+    CACHE_TTL_SECONDS: float = 300.0
+    CACHE_VERSION_CHECK_SECONDS: float = 1.0  # how stale the version may be per process
+
+    # Observability (GET /metrics)
+    SQL_ECHO: bool = False  # log every SQL statement (slow; metrics cover timings)
+    METRICS_TRACE_MEMORY: bool = False  # tracemalloc per pipeline stage (adds overhead)
+    PROFILE_DIR: str = "./profiles"  # sampled pipeline profiles (?profile=true)
+    PROFILE_INTERVAL_MS: float = 10.0
+
+    # API startup: pooled DB connections opened before serving, and whether to
+    # import the analytics stack (pandas) in the background right after startup
+    # instead of on the first pipeline call
+    DB_POOL_WARM: int = 4
+    PRELOAD_ANALYTICS: bool = False
+
+    # Background jobs (POST /analytics/run)
+    JOB_WORKERS: int = 1
+    JOB_HISTORY: int = 100  # finished jobs kept for GET /jobs/{id}
     
     class Config:
         env_file = ".env"
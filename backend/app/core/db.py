@@ -1,11 +1,41 @@
+from sqlalchemy import event
 from sqlmodel import SQLModel, create_engine, Session
 from app.core.config import settings
+from app.core.metrics import instrument_engine
 
-engine = create_engine(settings.DATABASE_URL, echo=True)
+engine = create_engine(settings.DATABASE_URL, echo=settings.SQL_ECHO)
+instrument_engine(engine)
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers keep reading the last committed state while a
+        # pipeline run writes, instead of waiting on the database lock.
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
 
 def get_session():
     with Session(engine) as session:
         yield session
 
+def warm_pool(connections: int) -> int:
+    """Open up to `connections` pooled connections now rather than on the first requests."""
+    size = getattr(engine.pool, "size", None)
+    if callable(size):
+        connections = min(connections, size())
+    opened = []
+    try:
+        for _ in range(connections):
+            conn = engine.connect()
+            conn.exec_driver_sql("SELECT 1")
+            opened.append(conn)
+    finally:
+        # Closing returns them to the pool, still open.
+        for conn in opened:
+            conn.close()
+    return len(opened)
+
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
@@ -1,18 +1,21 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from sqlmodel import Session, select
 import sys
 import os
 
 # Add backend to path so we can import app modules
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from app.core.db import engine, create_db_and_tables
+from app.core.db import create_db_and_tables
 from app.models.analysis import Recommendation, RFMProfile
 from app.models.customer import Customer
 from app.models.product import Product
 from app.models.order import Order # Fixes relationship resolution
+from app.services.cache import dataset_version
+from app.services.dashboard_data import (
+    fetch_counts, fetch_page, fetch_reasoning, summarize, window_options
+)
 
 st.set_page_config(page_title="E-commerce Predictive Analytics", layout="wide")
 
@@ -21,49 +24,39 @@ create_db_and_tables()
 
 st.title("📊 Predictive Analytics & Recommendations")
 
-def load_data():
-    """Load recommendations from database, returns empty DataFrame if no data or error."""
-    try:
-        with Session(engine) as session:
-            # Load Recommendations
-            recs_query = select(Recommendation, Customer, Product).join(Customer).join(Product)
-            recs = session.exec(recs_query).all()
-            
-            rec_data = []
-            for r, c, p in recs:
-                rec_data.append({
-                    "Customer ID": c.customer_id,
-                    "Customer Email": c.email,
-                    "Product": p.product_name,
-                    "Window": r.recommended_contact_window,
-                    "Confidence": r.confidence_level,
-                    "Reasoning": r.reasoning,
-                    "Date": r.generated_date
-                })
-                
-            if not rec_data:
-                return pd.DataFrame(columns=[
-                    "Customer ID", "Customer Email", "Product", 
-                    "Window", "Confidence", "Reasoning", "Date"
-                ])
-                
-            return pd.DataFrame(rec_data)
-    except Exception as e:
-        # If there's any error (table doesn't exist, config issue, etc), return empty DataFrame
-        # This allows the app to load so user can click "Generate Mock Data"
-        return pd.DataFrame(columns=[
-            "Customer ID", "Customer Email", "Product", 
-            "Window", "Confidence", "Reasoning", "Date"
-        ])
+PAGE_SIZE = 100
+EMPTY_COUNTS = pd.DataFrame(columns=["Window", "Confidence", "count"])
+
+# Every cached loader takes the dataset version as its first argument, so a
+# pipeline run or ingestion invalidates them and everything else is a cache hit.
+@st.cache_data(max_entries=8, show_spinner=False)
+def load_counts(version: int) -> pd.DataFrame:
+    return fetch_counts()
 
-df_recs = load_data()
+@st.cache_data(max_entries=64, show_spinner=False)
+def load_page(version: int, windows: tuple, cursor) -> pd.DataFrame:
+    return fetch_page(windows, cursor, PAGE_SIZE)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def load_reasoning(version: int, recommendation_id: int):
+    return fetch_reasoning(recommendation_id)
+
+try:
+    version = dataset_version()
+    counts = load_counts(version)
+except Exception as e:
+    # If there's any error (table doesn't exist, config issue, etc), show no data
+    # This allows the app to load so user can click "Generate Mock Data"
+    version, counts = 0, EMPTY_COUNTS
+
+summary = summarize(counts) if not counts.empty else None
 
 # --- Metrics Section ---
 col1, col2, col3 = st.columns(3)
-if not df_recs.empty:
-    col1.metric("Total Recommendations", len(df_recs))
-    col2.metric("High Confidence", len(df_recs[df_recs['Confidence'] == 'high']))
-    col3.metric("Urgent (Early/On-time)", len(df_recs[df_recs['Window'].isin(['Early Reminder', 'On-time'])]))
+if summary:
+    col1.metric("Total Recommendations", summary["total"])
+    col2.metric("High Confidence", summary["high_confidence"])
+    col3.metric("Urgent (Early/On-time)", summary["urgent"])
 
 st.divider()
 
@@ -71,16 +64,38 @@ st.divider()
 
 # Filters
 st.sidebar.header("Filters")
+all_windows = window_options(counts) if summary else []
 selected_window = st.sidebar.multiselect(
     "Contact Window", 
-    options=df_recs['Window'].unique(),
-    default=df_recs['Window'].unique()
+    options=all_windows,
+    default=all_windows
 )
 
-if not df_recs.empty:
-    filtered_df = df_recs[df_recs['Window'].isin(selected_window)]
+if summary:
+    matching = int(counts.loc[counts["Window"].isin(selected_window), "count"].sum())
+    n_pages = max(1, -(-matching // PAGE_SIZE))
+    # Keyset paging: the cursors of the pages visited so far (None = first
+    # page). Ids are only ordered within one dataset version and filter, so
+    # either changing starts again from the first page.
+    windows = tuple(sorted(selected_window))
+    if st.session_state.get("page_key") != (version, windows):
+        st.session_state.page_key = (version, windows)
+        st.session_state.cursors = [None]
+    cursors = st.session_state.cursors
+    page = len(cursors) - 1
+    filtered_df = load_page(version, windows, cursors[-1])
+
+    prev_col, next_col = st.sidebar.columns(2)
+    prev_col.button("◀ Previous", on_click=cursors.pop, disabled=page == 0)
+    next_col.button(
+        "Next ▶", on_click=cursors.append,
+        args=(int(filtered_df["ID"].iloc[-1]) if len(filtered_df) else None,),
+        disabled=page + 1 >= n_pages or filtered_df.empty,
+    )
+    st.sidebar.caption(f"Page {page + 1} of {n_pages}")
 
     st.subheader("Actionable Recommendations")
+    st.caption(f"{matching} matching recommendations")
     st.dataframe(
         filtered_df[['Customer ID', 'Customer Email', 'Product', 'Window', 'Confidence', 'Date']],
         use_container_width=True,
@@ -104,7 +119,8 @@ if not df_recs.empty:
             st.markdown(f"**Confidence:** :{confidence_color}[{selected_row['Confidence'].upper()}]")
             
             st.markdown("### 🧠 AI Reasoning")
-            st.write(selected_row['Reasoning'])
+            # Only the selected row's explanation is ever loaded
+            st.write(load_reasoning(version, int(selected_row['ID'])))
             
             st.button("Mark as Contacted", key="contact_btn")
 
@@ -118,13 +134,11 @@ if st.sidebar.button("⚡ Generate Mock Data (Reset DB)"):
             # Import here to avoid circulars or early exec issues if needed
             from app.core.db import create_db_and_tables
             from app.services.mock_data import create_mock_data
-            from app.services.rfm import run_rfm_analysis
-            from app.services.recommendation import run_recommendation_engine
+            from app.services.pipeline import run_pipeline
             
             create_db_and_tables()
-            create_mock_data()
-            run_rfm_analysis()
-            run_recommendation_engine()
+            create_mock_data(reset=True)
+            run_pipeline(full_rebuild=True)
         st.success("Data generated! Refreshing...")
         st.rerun()
     except Exception as e:
@@ -135,15 +149,17 @@ if st.sidebar.button("⚡ Generate Mock Data (Reset DB)"):
 st.divider()
 st.subheader("Analytics Overview")
 
-if not df_recs.empty:
+if summary:
     chart_col1, chart_col2 = st.columns(2)
     
     with chart_col1:
         st.write("**Recommendations by Window**")
-        fig_window = px.pie(df_recs, names='Window', hole=0.4)
+        by_window = counts.groupby("Window", as_index=False)["count"].sum()
+        fig_window = px.pie(by_window, names='Window', values='count', hole=0.4)
         st.plotly_chart(fig_window, use_container_width=True)
         
     with chart_col2:
         st.write("**Confidence Distribution**")
-        fig_conf = px.bar(df_recs, x='Confidence', color='Confidence')
+        by_confidence = counts.groupby("Confidence", as_index=False)["count"].sum()
+        fig_conf = px.bar(by_confidence, x='Confidence', y='count', color='Confidence')
         st.plotly_chart(fig_conf, use_container_width=True)
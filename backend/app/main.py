@@ -1,13 +1,37 @@
-from fastapi import FastAPI
+import asyncio
+import importlib
+import threading
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
+from app.core.config import settings
+from app.core.db import warm_pool
+from app.core.metrics import HTTP_REQUEST_SECONDS, render_metrics
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Load resources
-    print("Startup: Loading models...")
+    # Only cheap work before serving: the first request should not wait for
+    # pandas or for the serving store.
+    print("Startup: warming up...")
+    try:
+        opened = await asyncio.to_thread(warm_pool, settings.DB_POOL_WARM)
+        print(f"    {opened} DB connections ready")
+    except Exception as e:
+        print(f"DB pool not warmed: {e}")
+    if settings.SERVING_STORE:
+        # Reads use the DB until the store is loaded.
+        from app.services.serving import reload_in_background
+        reload_in_background()
+    if settings.PRELOAD_ANALYTICS:
+        threading.Thread(
+            target=importlib.import_module, args=("app.services.pipeline",), name="preload-analytics", daemon=True
+        ).start()
     yield
     # Clean up resources
     print("Shutdown: Cleaning up...")
+    from app.services.jobs import job_manager
+    job_manager.shutdown()
 
 app = FastAPI(
     title="E-commerce Predictive Analytics API",
@@ -16,9 +40,33 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template (/api/customers/{customer_id}), not raw path,
+        # to keep the series count bounded.
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(status),
+        )
+
 from app.api.routes import router
 app.include_router(router, prefix="/api")
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition of this process's metrics."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 async def root():
     return {"message": "System Operational", "status": "active"}
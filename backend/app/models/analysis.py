@@ -1,6 +1,7 @@
 from typing import Optional
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field, Relationship
-from datetime import date
+from datetime import date, datetime
 
 class RFMProfile(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -10,9 +11,21 @@ class RFMProfile(SQLModel, table=True):
     recency_days: int
     frequency: int
     monetary: float
-    rfm_score: str # e.g. "555" or "High-Value"
+    rfm_score: str # R, F and M quintiles (5 best), e.g. "555"
+    segment: str = "Standard" # Loyal, At Risk, Standard
+    # Last order of the pair and the day its consumption cycle runs out;
+    # indexed per generation for "due between" range scans (GET /due).
+    last_purchase_date: Optional[date] = None
+    expected_repurchase_date: Optional[date] = None
+    # Pipeline run that wrote the row; readers only see the published one
+    # (see app/services/generations.py).
+    generation: int = Field(default=0)
 
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = (
+        Index("ix_rfmprofile_generation_id", "generation", "id"),
+        Index("ix_rfmprofile_generation_due_id", "generation", "expected_repurchase_date", "id"),
+        {"extend_existing": True},
+    )
 
     # We might interpret "per CUSTOMER-PRODUCT pair" as:
     # frequency of THIS product, monetary of THIS product.
@@ -26,7 +39,68 @@ class Recommendation(SQLModel, table=True):
     confidence_level: str # low, medium, high
     reasoning: str # LLM generated text
     generated_date: date = Field(default_factory=date.today)
+    generation: int = Field(default=0)
 
-    __table_args__ = {"extend_existing": True}
+    # Reads always pin the published generation, and composite indexes end
+    # in `id` so filtered reads can page by keyset
+    # (WHERE generation = :g AND <filter> AND id > :cursor ORDER BY id).
+    __table_args__ = (
+        Index("ix_recommendation_generation_id", "generation", "id"),
+        Index("ix_recommendation_customer_product", "customer_id", "product_id"),
+        Index("ix_recommendation_window_confidence_id", "generation", "recommended_contact_window", "confidence_level", "id"),
+        Index("ix_recommendation_confidence_id", "generation", "confidence_level", "id"),
+        Index("ix_recommendation_product_id_id", "generation", "product_id", "id"),
+        Index("ix_recommendation_generated_date_id", "generation", "generated_date", "id"),
+        {"extend_existing": True},
+    )
 
     customer: "Customer" = Relationship(back_populates="recommendations")
+
+class RecommendationChange(SQLModel, table=True):
+    # Append-only log of how each pipeline run changed the published
+    # recommendations, per (customer_id, product_id). `seq` only grows, so
+    # downstream systems sync with GET /recommendations/changes?since=<seq>.
+    seq: Optional[int] = Field(default=None, primary_key=True)
+    generation: int
+    change_type: str # insert | update | delete
+    customer_id: str
+    product_id: str
+    recommended_contact_window: Optional[str] = None # None for deletes
+    confidence_level: Optional[str] = None
+    previous_contact_window: Optional[str] = None # None for inserts
+    previous_confidence_level: Optional[str] = None
+    changed_at: datetime
+
+    __table_args__ = {"extend_existing": True}
+
+class RecommendationRollup(SQLModel, table=True):
+    # Recommendation counts per window x confidence x product x seasonality,
+    # written by the pipeline's final stage for the published generation so
+    # headline numbers never scan Recommendation.
+    id: Optional[int] = Field(default=None, primary_key=True)
+    generation: int = Field(index=True)
+    recommended_contact_window: str
+    confidence_level: str
+    product_id: str
+    seasonality: str
+    recommendations: int
+
+    __table_args__ = {"extend_existing": True}
+
+class SegmentRollup(SQLModel, table=True):
+    # RFMProfile counts and monetary totals per segment (Loyal / At Risk / Standard).
+    id: Optional[int] = Field(default=None, primary_key=True)
+    generation: int = Field(index=True)
+    segment: str
+    profiles: int
+    monetary: float
+
+    __table_args__ = {"extend_existing": True}
+
+class PipelineState(SQLModel, table=True):
+    # Small key/value store for values the pipeline must remember between runs
+    # (e.g. the last order item processed by the RFM analysis).
+    key: str = Field(primary_key=True)
+    value: str
+
+    __table_args__ = {"extend_existing": True}
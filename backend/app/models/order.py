@@ -1,10 +1,11 @@
 from typing import Optional, List
 from datetime import date
+from sqlalchemy import DDL, event
 from sqlmodel import SQLModel, Field, Relationship
 
 class OrderBase(SQLModel):
     order_id: str = Field(primary_key=True)
-    customer_id: str = Field(foreign_key="customer.customer_id")
+    customer_id: str = Field(foreign_key="customer.customer_id", index=True)
     order_date: date
 
 class Order(OrderBase, table=True):
@@ -12,6 +13,13 @@ class Order(OrderBase, table=True):
     customer: "Customer" = Relationship(back_populates="orders")
     line_items: List["OrderItem"] = Relationship(back_populates="order")
 
+# Sharded runs select customer id ranges by code point (COLLATE "C"), which a
+# PostgreSQL index in a locale collation cannot serve. SQLite compares by
+# code point already.
+event.listen(Order.__table__, "after_create", DDL(
+    'CREATE INDEX IF NOT EXISTS ix_order_customer_id_c ON "order" (customer_id COLLATE "C")'
+).execute_if(dialect="postgresql"))
+
 class OrderItemBase(SQLModel):
     product_id: str = Field(foreign_key="product.product_id")
     quantity: int
@@ -19,7 +27,7 @@ class OrderItemBase(SQLModel):
 class OrderItem(OrderItemBase, table=True):
     __table_args__ = {"extend_existing": True}
     id: Optional[int] = Field(default=None, primary_key=True)
-    order_id: str = Field(foreign_key="order.order_id")
+    order_id: str = Field(foreign_key="order.order_id", index=True)
     
     order: "Order" = Relationship(back_populates="line_items")
     product: "Product" = Relationship(back_populates="order_items")
@@ -0,0 +1,6 @@
+from typing import List
+from pydantic import BaseModel, Field
+
+class CustomerBatchRequest(BaseModel):
+    """Customer ids for a batch customer-360 lookup (e.g. a CRM sync)."""
+    customer_ids: List[str] = Field(..., min_length=1, max_length=500)
@@ -0,0 +1,22 @@
+from datetime import date
+from typing import Optional
+from pydantic import BaseModel, Field, model_validator
+
+class MockDataRequest(BaseModel):
+    """Parameters for the synthetic dataset generator (see generate_dataset)."""
+    n_customers: int = Field(50, ge=1)
+    n_products: int = Field(20, ge=1)
+    n_orders: int = Field(500, ge=0)
+    min_items: int = Field(1, ge=1)
+    max_items: int = Field(3, ge=1)
+    span_days: int = Field(365 * 4, ge=1)
+    end_date: Optional[date] = None
+    cycle_realism: float = Field(0.8, ge=0.0, le=1.0)
+    seed: Optional[int] = None
+    reset: bool = False
+
+    @model_validator(mode="after")
+    def check_items_range(self) -> "MockDataRequest":
+        if self.max_items < self.min_items:
+            raise ValueError("max_items must be >= min_items")
+        return self
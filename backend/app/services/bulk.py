@@ -0,0 +1,122 @@
+import csv
+import io
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+from sqlalchemy import Table
+from sqlalchemy.engine import Connection
+from app.core.config import settings
+from app.core.db import engine
+from app.core.metrics import ROWS_WRITTEN
+
+@dataclass
+class BulkWriteStats:
+    table: str
+    rows: int
+    seconds: float
+    method: str
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else float(self.rows)
+
+    def __str__(self) -> str:
+        return (f"Wrote {self.rows} rows to {self.table} in {self.seconds:.2f}s "
+                f"({self.rows_per_sec:,.0f} rows/sec, {self.method})")
+
+def _to_columns(data: Any, columns: Optional[Sequence[str]]) -> Dict[str, List[Any]]:
+    """
+    Normalise a DataFrame, a mapping of column -> array, or a list of dicts
+    into plain Python lists per column (DB drivers reject numpy scalars).
+    """
+    if hasattr(data, "dtypes"):  # pandas DataFrame
+        names = list(columns or data.columns)
+        out = {}
+        for name in names:
+            series = data[name]
+            if str(series.dtype).startswith("datetime64"):
+                # NaT != NaT, so missing dates become NULL
+                out[name] = [d if d == d else None for d in series.dt.date]
+            else:
+                out[name] = series.tolist()
+        return out
+    if isinstance(data, dict):
+        names = list(columns or data.keys())
+        return {
+            name: data[name].tolist() if hasattr(data[name], "tolist") else list(data[name])
+            for name in names
+        }
+    rows = list(data)
+    names = list(columns or (rows[0].keys() if rows else []))
+    return {name: [row[name] for row in rows] for name in names}
+
+def _batches(cols: Dict[str, List[Any]], batch_size: int) -> Iterator[List[tuple]]:
+    names = list(cols)
+    total = len(cols[names[0]]) if names else 0
+    for start in range(0, total, batch_size):
+        stop = min(start + batch_size, total)
+        yield list(zip(*(cols[name][start:stop] for name in names)))
+
+def _copy_batch(connection: Connection, table: Table, names: List[str], batch: List[tuple]) -> None:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in batch:
+        writer.writerow(["\\N" if v is None else v for v in row])
+    buffer.seek(0)
+    column_list = ", ".join(f'"{name}"' for name in names)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            f'COPY "{table.name}" ({column_list}) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')',
+            buffer
+        )
+    finally:
+        cursor.close()
+
+def bulk_insert(
+    table: Table,
+    data: Any,
+    columns: Optional[Sequence[str]] = None,
+    batch_size: Optional[int] = None,
+    connection: Optional[Connection] = None,
+    method: Optional[str] = None,
+) -> BulkWriteStats:
+    """
+    Insert `data` into `table` in batches, without building ORM objects.
+
+    On PostgreSQL `method="copy"` (the default for "auto") streams each batch
+    through COPY FROM STDIN; everywhere else an executemany INSERT is used.
+    Pass `connection` to write inside an existing transaction (e.g.
+    `session.connection()`); otherwise every batch is committed in its own
+    short transaction, so the write lock is never held for the whole insert.
+    """
+    batch_size = batch_size or settings.BULK_BATCH_SIZE
+    method = method or settings.BULK_METHOD
+    if method == "auto":
+        method = "copy" if engine.dialect.name == "postgresql" else "executemany"
+
+    cols = _to_columns(data, columns)
+    names = list(cols)
+    start = time.perf_counter()
+    rows = 0
+
+    if method == "copy" and engine.dialect.name != "postgresql":
+        raise ValueError("COPY bulk inserts are only supported on PostgreSQL")
+    insert = table.insert()
+
+    def write(conn: Connection, batch: List[tuple]) -> None:
+        if method == "copy":
+            _copy_batch(conn, table, names, batch)
+        else:
+            conn.execute(insert, [dict(zip(names, row)) for row in batch])
+
+    for batch in _batches(cols, batch_size):
+        if connection is not None:
+            write(connection, batch)
+        else:
+            with engine.begin() as conn:
+                write(conn, batch)
+        rows += len(batch)
+
+    ROWS_WRITTEN.inc(rows, table=table.name)
+    return BulkWriteStats(table.name, rows, time.perf_counter() - start, method)
@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+from sqlalchemy import event, text
+from sqlmodel import Session
+from app.core.config import settings
+from app.core.db import engine
+from app.services.state import get_state, set_state
+
+# Bumped in the same commit as every generation flip and rollup rebuild, and
+# after ingestion. Cached read responses are keyed by it, so a bump
+# invalidates them in every API process.
+DATASET_VERSION_KEY = "dataset_version"
+
+class ResponseCache:
+    """Thread-safe LRU cache with a per-entry TTL and hit/miss counters."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "not_modified": 0}
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def count(self, counter: str) -> None:
+        with self._lock:
+            self.stats[counter] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries)}
+
+response_cache = ResponseCache(settings.CACHE_MAX_ENTRIES, settings.CACHE_TTL_SECONDS)
+
+_version_lock = threading.Lock()
+_version = {"value": None, "checked_at": 0.0}
+
+def _observe_version(version: int) -> int:
+    with _version_lock:
+        if version != _version["value"]:
+            response_cache.clear()
+        _version["value"] = version
+        _version["checked_at"] = time.monotonic()
+    return version
+
+def dataset_version() -> int:
+    """
+    Current dataset version. Re-read from the DB at most every
+    CACHE_VERSION_CHECK_SECONDS so cache hits cost no query; bumps made by
+    other processes become visible within that interval.
+    """
+    with _version_lock:
+        if (_version["value"] is not None
+                and time.monotonic() - _version["checked_at"] < settings.CACHE_VERSION_CHECK_SECONDS):
+            return _version["value"]
+    with Session(engine) as session:
+        version = int(get_state(session, DATASET_VERSION_KEY, "0"))
+    return _observe_version(version)
+
+def _expire_version(session: Session) -> None:
+    with _version_lock:
+        _version["checked_at"] = 0.0
+
+def advance_dataset_version(session: Session) -> None:
+    """Advance the dataset version when `session` commits, together with the data it changes."""
+    # Atomic increment so concurrent writers never hand out the same version.
+    updated = session.execute(
+        text("UPDATE pipelinestate SET value = CAST(CAST(value AS INTEGER) + 1 AS VARCHAR) WHERE key = :key"),
+        {"key": DATASET_VERSION_KEY}
+    ).rowcount
+    if not updated:
+        set_state(session, DATASET_VERSION_KEY, 1)
+    # This process re-reads the version on its next check instead of waiting
+    # out CACHE_VERSION_CHECK_SECONDS.
+    event.listen(session, "after_commit", _expire_version, once=True)
+
+def bump_dataset_version() -> int:
+    """Advance the dataset version after an ingestion commit."""
+    with Session(engine) as session:
+        advance_dataset_version(session)
+        session.commit()
+        version = int(get_state(session, DATASET_VERSION_KEY))
+    return _observe_version(version)
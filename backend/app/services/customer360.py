@@ -0,0 +1,73 @@
+from typing import Dict, List, Sequence
+from sqlmodel import Session, select
+from app.models.analysis import RFMProfile, Recommendation
+from app.models.customer import Customer
+from app.models.order import Order, OrderItem
+from app.models.product import Product
+from app.services.generations import active_generation
+
+def _columns(model, exclude: Sequence[str] = ()) -> list:
+    return [column for column in model.__table__.c if column.name not in exclude]
+
+def load_customer_360(session: Session, customer_ids: Sequence[str]) -> Dict[str, dict]:
+    """
+    Full profile of each customer, keyed by id in request order: orders with
+    line items and products, the published RFM profiles and recommendations.
+    Unknown ids are left out.
+
+    Seven queries whatever the batch size: one per table (customers, orders,
+    line items with products, RFM profiles, recommendations) plus the two
+    generation lookups.
+    """
+    ids = list(dict.fromkeys(customer_ids))
+    if not ids:
+        return {}
+    recommendation_generation = active_generation(session, "recommendation")
+    profile_generation = active_generation(session, "rfmprofile")
+
+    result = {
+        row["customer_id"]: {**row, "orders": [], "rfm_profiles": [], "recommendations": []}
+        for row in session.execute(
+            select(*_columns(Customer)).where(Customer.customer_id.in_(ids))
+        ).mappings()
+    }
+
+    orders = {}
+    for row in session.execute(
+        select(Order.order_id, Order.customer_id, Order.order_date)
+        .where(Order.customer_id.in_(ids))
+        .order_by(Order.order_date.desc(), Order.order_id.desc())
+    ):
+        order = {"order_id": row.order_id, "order_date": row.order_date, "line_items": []}
+        orders[row.order_id] = order
+        result[row.customer_id]["orders"].append(order)
+
+    for row in session.execute(
+        select(OrderItem.order_id, OrderItem.product_id, Product.product_name, OrderItem.quantity, Product.price)
+        .join(Order, Order.order_id == OrderItem.order_id)
+        .outerjoin(Product, Product.product_id == OrderItem.product_id)
+        .where(Order.customer_id.in_(ids))
+        .order_by(OrderItem.id)
+    ):
+        orders[row.order_id]["line_items"].append({
+            "product_id": row.product_id,
+            "product_name": row.product_name,
+            "quantity": row.quantity,
+            "price": row.price,
+        })
+
+    related = [
+        ("rfm_profiles", RFMProfile, RFMProfile.generation == profile_generation, ["id", "generation"]),
+        ("recommendations", Recommendation, Recommendation.generation == recommendation_generation, ["generation"]),
+    ]
+    for key, model, published, exclude in related:
+        for row in session.execute(
+            select(model.customer_id, *_columns(model, exclude=["customer_id", *exclude]))
+            .where(published, model.customer_id.in_(ids))
+            .order_by(model.id)
+        ).mappings():
+            row = dict(row)
+            result[row.pop("customer_id")][key].append(row)
+
+    # Preserve the requested order.
+    return {customer_id: result[customer_id] for customer_id in ids if customer_id in result}
@@ -0,0 +1,84 @@
+# Queries behind the Streamlit dashboard. Each returns a small aggregated or
+# paged frame; the dashboard caches them per dataset version.
+from typing import List, Optional, Sequence
+import pandas as pd
+from sqlalchemy import func
+from sqlmodel import Session, select
+from app.core.db import engine
+from app.models.analysis import Recommendation
+from app.models.customer import Customer
+from app.models.product import Product
+from app.services.generations import active_generation
+from app.services.rollups import URGENT_WINDOWS, load_summary
+
+TABLE_COLUMNS = ["ID", "Customer ID", "Customer Email", "Product", "Window", "Confidence", "Date"]
+
+def fetch_counts() -> pd.DataFrame:
+    """Recommendation counts per (window, confidence), from the pipeline's rollups."""
+    with Session(engine) as session:
+        summary = load_summary(session)
+        if summary["generation"] is not None:
+            return pd.DataFrame(
+                [(c["window"], c["confidence"], c["count"]) for c in summary["by_window_confidence"]],
+                columns=["Window", "Confidence", "count"]
+            )
+        # No rollups yet (pipeline not run since they were added): group in the DB.
+        rows = session.exec(
+            select(
+                Recommendation.recommended_contact_window,
+                Recommendation.confidence_level,
+                func.count(Recommendation.id),
+            ).where(Recommendation.generation == active_generation(session, "recommendation")
+            ).group_by(Recommendation.recommended_contact_window, Recommendation.confidence_level)
+        ).all()
+    return pd.DataFrame(rows, columns=["Window", "Confidence", "count"])
+
+def summarize(counts: pd.DataFrame) -> dict:
+    """Headline metrics from the grouped counts."""
+    return {
+        "total": int(counts["count"].sum()),
+        "high_confidence": int(counts.loc[counts["Confidence"] == "high", "count"].sum()),
+        "urgent": int(counts.loc[counts["Window"].isin(URGENT_WINDOWS), "count"].sum()),
+    }
+
+def _window_filter(statement, windows: Optional[Sequence[str]]):
+    if windows is not None:
+        statement = statement.where(Recommendation.recommended_contact_window.in_(list(windows)))
+    return statement
+
+def fetch_page(windows: Optional[Sequence[str]], cursor: Optional[int], page_size: int) -> pd.DataFrame:
+    """
+    One page of the table, with only the displayed columns (no reasoning text).
+
+    Keyset paging like GET /recommendations: the page starts after id
+    `cursor` (the last ID of the previous page; None for the first), so deep
+    pages read through the (generation, id) index instead of skipping rows.
+    """
+    statement = select(
+        Recommendation.id,
+        Customer.customer_id,
+        Customer.email,
+        Product.product_name,
+        Recommendation.recommended_contact_window,
+        Recommendation.confidence_level,
+        Recommendation.generated_date,
+    ).join(Customer, Customer.customer_id == Recommendation.customer_id
+    ).join(Product, Product.product_id == Recommendation.product_id)
+    statement = _window_filter(statement, windows)
+    if cursor is not None:
+        statement = statement.where(Recommendation.id > cursor)
+    statement = statement.order_by(Recommendation.id).limit(page_size)
+    with Session(engine) as session:
+        generation = active_generation(session, "recommendation")
+        rows = session.exec(statement.where(Recommendation.generation == generation)).all()
+    return pd.DataFrame(rows, columns=TABLE_COLUMNS)
+
+def fetch_reasoning(recommendation_id: int) -> Optional[str]:
+    """The explanation text of a single recommendation, loaded on demand."""
+    with Session(engine) as session:
+        return session.exec(
+            select(Recommendation.reasoning).where(Recommendation.id == recommendation_id)
+        ).first()
+
+def window_options(counts: pd.DataFrame) -> List[str]:
+    return sorted(counts["Window"].unique().tolist())
@@ -1,23 +1,184 @@
+import asyncio
 import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Sequence
+from app.core.config import settings
 
 def generate_explanation(customer_id, product_name, days_until_due, confidence, window):
     # In a real system, this would call Gemini.
     # For MVP without valid API key loop, we mock it or prepare the prompt.
-    
+
     # Prompt Design as requested:
     # "Explanation prompt must include: last_purchase_date, consumption_cycle, recency..."
-    
+
     base_reasons = [
         f"Customer usually buys {product_name} every few weeks.",
         f"Based on purchase history, {product_name} should be running low.",
         f"High frequency shopper for {product_name}. Good time to restock."
     ]
-    
+
     reason = random.choice(base_reasons)
-    
+
     if window == "Early Reminder":
         return f"Proactive: {reason} Expected need in {days_until_due} days."
     elif window == "Follow-up (Late)":
         return f"Missed Cycle: {reason} They are {abs(days_until_due)} days overdue."
     else:
         return f"Routine: {reason} Confidence is {confidence}."
+
+def days_bucket(days_until_due: int) -> int:
+    """
+    Collapse days-until-due into the granularity an explanation needs: exact
+    inside the contact windows (-7..5 days), weekly beyond that.
+    """
+    if -7 <= days_until_due <= 5:
+        return days_until_due
+    return (days_until_due // 7) * 7
+
+class ExplanationPrompt(NamedTuple):
+    """The salient inputs of an explanation; identical prompts share one answer."""
+    product_name: str
+    window: str
+    confidence: str
+    days_bucket: int
+
+    def text(self) -> str:
+        timing = (f"expected to need it again in {self.days_bucket} days" if self.days_bucket >= 0
+                  else f"about {abs(self.days_bucket)} days past their usual repurchase date")
+        return (
+            "Write one short sentence for a marketing assistant explaining why a customer "
+            f"should be contacted about {self.product_name}. Contact window: {self.window}. "
+            f"Confidence: {self.confidence}. The customer is {timing}."
+        )
+
+# Windows whose canned sentence mentions the day count; for the others the
+# template text does not depend on it.
+TEMPLATE_DAY_WINDOWS = ("Early Reminder", "Follow-up (Late)")
+
+class TemplateBackend:
+    """Local canned sentences (the original MVP behaviour); no network."""
+    # Local backends are resolved synchronously: no quota, nothing to wait on.
+    remote = False
+
+    def explain(self, prompt: ExplanationPrompt) -> str:
+        return generate_explanation(None, prompt.product_name, prompt.days_bucket,
+                                    prompt.confidence, prompt.window)
+
+    async def complete(self, prompt: ExplanationPrompt) -> str:
+        return self.explain(prompt)
+
+class FakeLLMBackend(TemplateBackend):
+    """Offline stand-in for a remote model: template text after a fixed latency."""
+    remote = True
+
+    def __init__(self, latency_ms: float):
+        self.latency = latency_ms / 1000.0
+
+    async def complete(self, prompt: ExplanationPrompt) -> str:
+        await asyncio.sleep(self.latency)
+        return await super().complete(prompt)
+
+class GeminiBackend:
+    remote = True
+
+    def __init__(self, api_key: str, model: str):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model)
+
+    async def complete(self, prompt: ExplanationPrompt) -> str:
+        response = await self.model.generate_content_async(prompt.text())
+        return response.text.strip()
+
+def get_backend(name: Optional[str] = None):
+    name = name or settings.EXPLANATION_BACKEND
+    if name == "template":
+        return TemplateBackend()
+    if name == "fake":
+        return FakeLLMBackend(settings.EXPLANATION_FAKE_LATENCY_MS)
+    if name == "gemini":
+        if not settings.GEMINI_API_KEY:
+            raise ValueError("EXPLANATION_BACKEND=gemini requires GEMINI_API_KEY")
+        return GeminiBackend(settings.GEMINI_API_KEY, settings.GEMINI_MODEL)
+    raise ValueError(f"Unknown explanation backend: {name}")
+
+class _RateLimiter:
+    """Spaces request starts at least 1/rate seconds apart (rate <= 0: unlimited)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+# Memoized answers shared by every run in this process.
+_cache: "OrderedDict[ExplanationPrompt, str]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _cache_get_many(prompts: Sequence[ExplanationPrompt]) -> Dict[ExplanationPrompt, str]:
+    with _cache_lock:
+        found = {}
+        for prompt in prompts:
+            if prompt in _cache:
+                _cache.move_to_end(prompt)
+                found[prompt] = _cache[prompt]
+        return found
+
+def _cache_put_many(answers: Dict[ExplanationPrompt, str]) -> None:
+    with _cache_lock:
+        _cache.update(answers)
+        while len(_cache) > settings.EXPLANATION_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+async def _fetch_all(backend, prompts: List[ExplanationPrompt]) -> Dict[ExplanationPrompt, str]:
+    semaphore = asyncio.Semaphore(settings.EXPLANATION_CONCURRENCY)
+    limiter = _RateLimiter(settings.EXPLANATION_RATE_LIMIT)
+    fallback = TemplateBackend()
+
+    async def fetch(prompt: ExplanationPrompt):
+        async with semaphore:
+            await limiter.wait()
+            try:
+                return prompt, await backend.complete(prompt)
+            except Exception as e:
+                # One failed call must not sink the run; use the canned text.
+                print(f"Explanation backend failed for {prompt}: {e}")
+                return prompt, await fallback.complete(prompt)
+
+    return dict(await asyncio.gather(*(fetch(p) for p in prompts)))
+
+def explain_many(prompts: Sequence[ExplanationPrompt], backend=None) -> Dict[ExplanationPrompt, str]:
+    """
+    Resolve a set of prompts to explanation texts.
+
+    Prompts already in the memo cache are answered from it; the rest are sent
+    to a remote backend concurrently (EXPLANATION_CONCURRENCY in flight, at
+    most EXPLANATION_RATE_LIMIT starts per second) or rendered in a plain loop
+    by a local one. Pass unique prompts: the result is keyed by prompt.
+    """
+    backend = backend or get_backend()
+    unique = list(dict.fromkeys(prompts))
+    answers = _cache_get_many(unique)
+    missing = [p for p in unique if p not in answers]
+    if missing:
+        start = time.perf_counter()
+        if backend.remote:
+            fetched = asyncio.run(_fetch_all(backend, missing))
+        else:
+            fetched = {prompt: backend.explain(prompt) for prompt in missing}
+        _cache_put_many(fetched)
+        answers.update(fetched)
+        print(f"    Explanations: {len(missing)} generated in {time.perf_counter() - start:.2f}s, "
+              f"{len(unique) - len(missing)} from cache")
+    return answers
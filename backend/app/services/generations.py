@@ -0,0 +1,56 @@
+from sqlalchemy import text
+from sqlmodel import Session
+from app.core.config import settings
+from app.core.db import engine
+from app.services.cache import advance_dataset_version
+from app.services.state import get_state, set_state
+
+# Pipeline outputs are written as a new "generation" of rows next to the
+# published one. Readers filter on the published generation, which is flipped
+# by a single-row state update once the staging rows are complete. The last
+# GENERATIONS_RETAINED generations stay readable (for paged clients and
+# exports that pinned one); older rows are deleted in small batches.
+
+def _key(table: str) -> str:
+    return f"generation.{table}"
+
+def active_generation(session: Session, table: str) -> int:
+    """The generation readers of `table` should see."""
+    return int(get_state(session, _key(table), "0"))
+
+def begin_generation(table: str) -> int:
+    """Return the staging generation for a new run, clearing leftovers of failed runs."""
+    with Session(engine) as session:
+        active = active_generation(session, table)
+    _delete_batched(table, "generation > :active", {"active": active})
+    return active + 1
+
+def publish_generation(session: Session, table: str, generation: int) -> None:
+    """Switch readers to `generation` when `session` commits; cached reads are invalidated in the same commit."""
+    set_state(session, _key(table), generation)
+    advance_dataset_version(session)
+
+def is_readable(session: Session, table: str, generation: int) -> bool:
+    """Whether `generation` is published or still retained."""
+    active = active_generation(session, table)
+    return active - settings.GENERATIONS_RETAINED <= generation <= active
+
+def collect_garbage(table: str) -> int:
+    """Delete generations past the retention window. Returns rows deleted."""
+    with Session(engine) as session:
+        oldest = active_generation(session, table) - settings.GENERATIONS_RETAINED
+    return _delete_batched(table, "generation < :oldest", {"oldest": oldest})
+
+def _delete_batched(table: str, condition: str, params: dict) -> int:
+    # Short transactions so writers never hold the lock for the whole cleanup.
+    deleted = 0
+    statement = text(
+        f"DELETE FROM {table} WHERE id IN "
+        f"(SELECT id FROM {table} WHERE {condition} LIMIT :batch)"
+    )
+    while True:
+        with engine.begin() as conn:
+            count = conn.execute(statement, {**params, "batch": settings.BULK_BATCH_SIZE}).rowcount
+        deleted += count
+        if count < settings.BULK_BATCH_SIZE:
+            return deleted
@@ -0,0 +1,339 @@
+import argparse
+import codecs
+import csv
+import json
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional
+from sqlalchemy import bindparam, select, text
+from app.core.config import settings
+from app.core.db import engine
+from app.core.metrics import ROWS_WRITTEN
+from app.models.customer import Customer
+from app.models.order import Order, OrderItem
+from app.models.product import Product
+from app.services.bulk import bulk_insert
+from app.services.cache import bump_dataset_version
+
+FORMATS = ("ndjson", "csv")
+CSV_REQUIRED = ["order_id", "customer_id", "order_date", "product_id", "quantity"]
+# Conflicting order ids listed in an upload's stats (the count is always exact).
+MAX_REPORTED_CONFLICTS = 100
+
+# Customer aggregates are recomputed from the stored orders for the customers
+# a batch touched, so replays and partially failed uploads never double count.
+REFRESH_CUSTOMERS = text("""
+    UPDATE customer SET
+        total_orders = (SELECT COUNT(*) FROM "order" o WHERE o.customer_id = customer.customer_id),
+        first_purchase_date = (SELECT MIN(o.order_date) FROM "order" o WHERE o.customer_id = customer.customer_id),
+        last_purchase_date = (SELECT MAX(o.order_date) FROM "order" o WHERE o.customer_id = customer.customer_id),
+        total_spent = (
+            SELECT COALESCE(SUM(oi.quantity * p.price), 0)
+            FROM "order" o
+            JOIN orderitem oi ON oi.order_id = o.order_id
+            JOIN product p ON p.product_id = oi.product_id
+            WHERE o.customer_id = customer.customer_id
+        )
+    WHERE customer_id IN :ids
+""").bindparams(bindparam("ids", expanding=True))
+
+class IngestError(ValueError):
+    """A malformed record in an order upload."""
+
+@dataclass
+class IngestStats:
+    orders: int = 0  # complete orders parsed
+    inserted: int = 0  # orders that were new
+    duplicates: int = 0  # identical re-sends of stored (or earlier uploaded) orders
+    conflicts: int = 0  # re-sends whose content differs; not written
+    conflict_ids: List[str] = field(default_factory=list)
+    line_items: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+
+    @property
+    def orders_per_sec(self) -> float:
+        return self.orders / self.seconds if self.seconds > 0 else float(self.orders)
+
+    def to_dict(self) -> dict:
+        return {
+            "orders": self.orders,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "conflicts": self.conflicts,
+            "conflicting_order_ids": self.conflict_ids,
+            "line_items": self.line_items,
+            "batches": self.batches,
+            "seconds": round(self.seconds, 3),
+            "orders_per_sec": round(self.orders_per_sec, 1),
+        }
+
+def _insert_ignore(table):
+    """INSERT ... ON CONFLICT DO NOTHING for the configured dialect."""
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table).on_conflict_do_nothing()
+
+def _content(customer_id: str, order_date: date, items: Iterable[tuple]) -> tuple:
+    """What identifies an order's content: its customer, date and (product, quantity) lines."""
+    return customer_id, order_date, Counter(items)
+
+def _order_content(order: dict) -> tuple:
+    return _content(order["customer_id"], order["order_date"],
+                    ((item["product_id"], item["quantity"]) for item in order["line_items"]))
+
+def _stored_contents(conn, order_ids: List[str]) -> Dict[str, tuple]:
+    rows = conn.execute(
+        select(Order.order_id, Order.customer_id, Order.order_date, OrderItem.product_id, OrderItem.quantity)
+        .outerjoin(OrderItem, OrderItem.order_id == Order.order_id)
+        .where(Order.order_id.in_(order_ids))
+    )
+    stored: Dict[str, tuple] = {}
+    for row in rows:
+        content = stored.setdefault(row.order_id, _content(row.customer_id, row.order_date, ()))
+        if row.product_id is not None:
+            content[2][(row.product_id, row.quantity)] += 1
+    return stored
+
+def _parse_date(value: Any) -> date:
+    # Shopify sends full timestamps; the order date is the calendar day.
+    return date.fromisoformat(str(value)[:10])
+
+def _item(record: dict) -> dict:
+    price = record.get("price")
+    return {
+        "product_id": str(record["product_id"]),
+        "quantity": int(record["quantity"]),
+        "product_name": record.get("product_name") or None,
+        "price": float(price) if price not in (None, "") else None,
+    }
+
+class OrderStreamParser:
+    """
+    Incremental parser for order uploads.
+
+    `feed` takes raw bytes as they arrive and returns the orders completed so
+    far; partial lines are kept until the next chunk. NDJSON carries one order
+    per line with a `line_items` list. CSV carries one line item per row
+    (header required, quoted newlines unsupported); the rows of an order must
+    be contiguous.
+    """
+
+    def __init__(self, fmt: str):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown upload format {fmt!r}; expected one of {FORMATS}")
+        self.fmt = fmt
+        self.line_no = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._pending = ""
+        self._header: Optional[List[str]] = None
+        self._current: Optional[dict] = None  # CSV order being assembled
+
+    def feed(self, chunk: bytes) -> List[dict]:
+        lines = (self._pending + self._decoder.decode(chunk)).split("\n")
+        self._pending = lines.pop()
+        return self._parse(lines)
+
+    def close(self) -> List[dict]:
+        orders = self._parse([self._pending + self._decoder.decode(b"", final=True)])
+        self._pending = ""
+        if self._current is not None:
+            orders.append(self._current)
+            self._current = None
+        return orders
+
+    def _parse(self, lines: List[str]) -> List[dict]:
+        orders = []
+        for line in lines:
+            self.line_no += 1
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                order = self._parse_json(line) if self.fmt == "ndjson" else self._parse_csv(line)
+            except IngestError:
+                raise
+            except (ValueError, KeyError, TypeError) as e:
+                raise IngestError(f"Line {self.line_no}: {e!r}") from e
+            if order is not None:
+                orders.append(order)
+        return orders
+
+    def _parse_json(self, line: str) -> dict:
+        record = json.loads(line)
+        return {
+            "order_id": str(record["order_id"]),
+            "customer_id": str(record["customer_id"]),
+            "email": record.get("email") or "",
+            "order_date": _parse_date(record["order_date"]),
+            "line_items": [_item(item) for item in record["line_items"]],
+        }
+
+    def _parse_csv(self, line: str) -> Optional[dict]:
+        values = next(csv.reader([line]))
+        if self._header is None:
+            missing = set(CSV_REQUIRED) - set(values)
+            if missing:
+                raise IngestError(f"CSV header is missing columns: {sorted(missing)}")
+            self._header = values
+            return None
+        record = dict(zip(self._header, values))
+        completed = None
+        if self._current is None or self._current["order_id"] != record["order_id"]:
+            completed = self._current
+            self._current = {
+                "order_id": record["order_id"],
+                "customer_id": record["customer_id"],
+                "email": record.get("email") or "",
+                "order_date": _parse_date(record["order_date"]),
+                "line_items": [],
+            }
+        self._current["line_items"].append(_item(record))
+        return completed
+
+class OrderIngestor:
+    """
+    Batches parsed orders and writes each batch in one short transaction.
+
+    Orders are insert-only, keyed on order_id: an order that is already
+    stored is skipped together with its line items, so a failed upload can
+    simply be sent again. Stored orders are never modified (the RFM watermark
+    and the snapshot assume order lines are append-only); a re-send whose
+    customer, date or lines differ from the stored order is counted as a
+    conflict and its id reported, instead of as a duplicate. Unknown
+    customers and products are created (products with the catalogue defaults
+    unless the line item carries `product_name`/`price`).
+    """
+
+    def __init__(self, fmt: str, batch_size: Optional[int] = None):
+        self.parser = OrderStreamParser(fmt)
+        self.batch_size = batch_size or settings.INGEST_BATCH_SIZE
+        self.stats = IngestStats()
+        self._batch: List[dict] = []
+
+    def feed(self, chunk: bytes) -> List[List[dict]]:
+        """Parse a chunk; returns the batches that are full and ready to write."""
+        return self._collect(self.parser.feed(chunk))
+
+    def close(self) -> List[List[dict]]:
+        """Flush the parser; returns the remaining batches."""
+        batches = self._collect(self.parser.close())
+        if self._batch:
+            batches.append(self._batch)
+            self._batch = []
+        return batches
+
+    def _collect(self, orders: List[dict]) -> List[List[dict]]:
+        batches = []
+        for order in orders:
+            self._batch.append(order)
+            if len(self._batch) >= self.batch_size:
+                batches.append(self._batch)
+                self._batch = []
+        return batches
+
+    def write(self, batch: List[dict]) -> None:
+        start = time.perf_counter()
+        orders: Dict[str, dict] = {}
+        conflicts: List[str] = []
+        for order in batch:
+            first = orders.setdefault(order["order_id"], order)
+            if first is not order and _order_content(first) != _order_content(order):
+                conflicts.append(order["order_id"])
+
+        customers: Dict[str, str] = {}
+        products: Dict[str, dict] = {}
+        for order in orders.values():
+            customers.setdefault(order["customer_id"], order["email"])
+            for item in order["line_items"]:
+                products.setdefault(item["product_id"], item)
+
+        with engine.begin() as conn:
+            conn.execute(_insert_ignore(Customer.__table__), [
+                {"customer_id": customer_id, "email": email, "first_purchase_date": None,
+                 "last_purchase_date": None, "total_orders": 0, "total_spent": 0.0}
+                for customer_id, email in customers.items()
+            ])
+            conn.execute(_insert_ignore(Product.__table__), [
+                Product(
+                    product_id=product_id,
+                    product_name=item["product_name"] or product_id,
+                    **({"price": item["price"]} if item["price"] is not None else {}),
+                ).model_dump()
+                for product_id, item in products.items()
+            ])
+            # RETURNING yields only the rows that did not conflict: the new orders.
+            inserted = set(conn.execute(
+                _insert_ignore(Order.__table__).returning(Order.__table__.c.order_id),
+                [{"order_id": o["order_id"], "customer_id": o["customer_id"], "order_date": o["order_date"]}
+                 for o in orders.values()]
+            ).scalars())
+
+            items = {"order_id": [], "product_id": [], "quantity": []}
+            for order_id in inserted:
+                for item in orders[order_id]["line_items"]:
+                    items["order_id"].append(order_id)
+                    items["product_id"].append(item["product_id"])
+                    items["quantity"].append(item["quantity"])
+            if items["order_id"]:
+                bulk_insert(OrderItem.__table__, items, connection=conn)
+            touched = list({orders[order_id]["customer_id"] for order_id in inserted})
+            if touched:
+                conn.execute(REFRESH_CUSTOMERS, {"ids": touched})
+
+            skipped = [order_id for order_id in orders if order_id not in inserted]
+            if skipped:
+                stored = _stored_contents(conn, skipped)
+                conflicts += [order_id for order_id in skipped
+                              if stored[order_id] != _order_content(orders[order_id])]
+
+        ROWS_WRITTEN.inc(len(inserted), table=Order.__tablename__)
+        self.stats.orders += len(batch)
+        self.stats.inserted += len(inserted)
+        self.stats.duplicates += len(batch) - len(inserted) - len(conflicts)
+        self.stats.conflicts += len(conflicts)
+        room = MAX_REPORTED_CONFLICTS - len(self.stats.conflict_ids)
+        self.stats.conflict_ids += list(dict.fromkeys(conflicts))[:max(room, 0)]
+        self.stats.line_items += len(items["order_id"])
+        self.stats.batches += 1
+        self.stats.seconds += time.perf_counter() - start
+
+def finish_ingest(stats: IngestStats) -> None:
+    """Invalidate cached reads once an upload has added orders."""
+    if stats.inserted:
+        bump_dataset_version()
+    print(f"Ingested {stats.inserted} new orders ({stats.duplicates} duplicates, "
+          f"{stats.conflicts} conflicts, {stats.line_items} line items) "
+          f"at {stats.orders_per_sec:,.0f} orders/sec")
+    if stats.conflicts:
+        print(f"    Conflicting re-sends were not written: {', '.join(stats.conflict_ids)}")
+
+def ingest_orders(chunks: Iterable[bytes], fmt: str, batch_size: Optional[int] = None) -> IngestStats:
+    """Ingest an upload given as an iterable of byte chunks (e.g. a file read in blocks)."""
+    ingestor = OrderIngestor(fmt, batch_size)
+    for chunk in chunks:
+        for batch in ingestor.feed(chunk):
+            ingestor.write(batch)
+    for batch in ingestor.close():
+        ingestor.write(batch)
+    finish_ingest(ingestor.stats)
+    return ingestor.stats
+
+if __name__ == "__main__":
+    from app.core.db import create_db_and_tables
+    parser = argparse.ArgumentParser(description="Ingest an NDJSON or CSV order export.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS, default=None,
+                        help="Defaults to csv for .csv files, ndjson otherwise")
+    parser.add_argument("--batch-size", type=int, default=None)
+    args = parser.parse_args()
+
+    create_db_and_tables()
+    fmt = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    with open(args.path, "rb") as f:
+        stats = ingest_orders(iter(lambda: f.read(1 << 20), b""), fmt, args.batch_size)
+    print(stats.to_dict())
@@ -0,0 +1,105 @@
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+from app.core.config import settings
+
+class JobConflict(Exception):
+    """A job with the same key is already active with different parameters."""
+
+class Job:
+    def __init__(self, key: str, params: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.params = params
+        self.status = "queued" # queued | running | succeeded | failed
+        self.progress = 0.0
+        self.current_stage: Optional[str] = None
+        self.stages: Dict[str, float] = {}
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def report(self, stage: str, index: int, total: int, timings: Dict[str, float]) -> None:
+        """Progress callback for run_pipeline's `on_stage` hook."""
+        self.current_stage = stage
+        self.progress = round(index / total, 3) if total else 0.0
+        self.stages = timings
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "key": self.key,
+            "params": self.params,
+            "status": self.status,
+            "progress": self.progress,
+            "current_stage": self.current_stage,
+            "stages": dict(self.stages),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+class JobManager:
+    """
+    Runs long jobs on a worker pool so request handlers return immediately.
+
+    Jobs share a `key`: while one is queued or running, submitting the same
+    key with the same params returns the active job instead of starting a
+    second run; different params raise JobConflict.
+    """
+    def __init__(self, max_workers: int = 1, history: int = 100):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._active: Dict[str, Job] = {}
+        self._history = history
+
+    def submit(self, key: str, fn: Callable[..., Any], **params) -> Tuple[Job, bool]:
+        """Start `fn(job, **params)` in the pool. Returns (job, created)."""
+        with self._lock:
+            active = self._active.get(key)
+            if active and not active.done:
+                if active.params != params:
+                    raise JobConflict(f"Job {active.id} for '{key}' is already {active.status}")
+                return active, False
+            job = Job(key, params)
+            self._active[key] = job
+            self._jobs[job.id] = job
+            while len(self._jobs) > self._history:
+                self._jobs.popitem(last=False)
+        self._executor.submit(self._run, job, fn)
+        return job, True
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def _run(self, job: Job, fn: Callable[..., Any]) -> None:
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        try:
+            job.result = fn(job, **job.params)
+            job.progress = 1.0
+            job.current_stage = None
+            job.status = "succeeded"
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = "failed"
+            print(f"Job {job.id} ({job.key}) failed: {job.error}")
+        finally:
+            job.finished_at = datetime.utcnow()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+job_manager = JobManager(max_workers=settings.JOB_WORKERS, history=settings.JOB_HISTORY)
@@ -1,96 +1,211 @@
-import random
-import uuid
-from datetime import date, timedelta
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import date
+from typing import Optional
 from sqlmodel import Session, select
 from app.models.customer import Customer
 from app.models.product import Product
 from app.models.order import Order, OrderItem
+from app.models.analysis import (
+    RFMProfile, Recommendation, PipelineState, RecommendationRollup, SegmentRollup
+)
 from app.core.db import engine
+from app.services.bulk import bulk_insert
+from app.services.cache import bump_dataset_version
+from app.services.recommendation import record_reset
+from app.services.snapshot import bump_epoch
 
-def create_mock_data():
+CYCLES = [30, 45, 60, 90]
+SEASONS = ["all_year", "summer", "winter"]
+ROUTINE_SIZE = 3 # products each customer buys on a regular cycle
+
+# Children first so foreign keys never dangle while resetting.
+# The recommendation change log is kept; the reset appends to it.
+RESET_TABLES = [
+    RecommendationRollup, SegmentRollup, Recommendation, RFMProfile, OrderItem, Order, Customer, Product
+]
+
+def _ids(prefix: str, n: int) -> pd.Series:
+    width = max(3, len(str(n)))
+    return prefix + pd.Series(np.arange(1, n + 1)).astype(str).str.zfill(width)
+
+def _reset(conn) -> None:
+    record_reset(conn)
+    for model in RESET_TABLES:
+        conn.execute(model.__table__.delete())
+    # Forget the RFM watermark; counters such as the dataset version must keep
+    # increasing across resets.
+    conn.execute(PipelineState.__table__.delete().where(PipelineState.key.like("rfm.%")))
+    bump_epoch(conn)
+
+def generate_dataset(
+    n_customers: int = 50,
+    n_products: int = 20,
+    n_orders: int = 500,
+    min_items: int = 1,
+    max_items: int = 3,
+    span_days: int = 365 * 4,
+    end_date: Optional[date] = None,
+    cycle_realism: float = 0.8,
+    seed: Optional[int] = None,
+    reset: bool = False,
+) -> dict:
+    """
+    Generate and bulk-load a synthetic order history.
+
+    Every random draw comes from one generator seeded with `seed`, so the same
+    parameters (and a pinned `end_date`) always produce the same dataset.
+    `cycle_realism` is the share of orders that follow a customer's routine:
+    the order repeats one of the customer's usual products, roughly one
+    consumption cycle after the previous order. The rest are spread at random.
+    """
+    if min_items < 1 or max_items < min_items:
+        raise ValueError("Expected 1 <= min_items <= max_items")
+    rng = np.random.default_rng(seed)
+    end_date = end_date or date.today()
+
+    # 1. Products
+    products = pd.DataFrame({
+        "product_id": _ids("PROD-", n_products),
+        "product_name": "Product " + pd.Series(np.arange(1, n_products + 1)).astype(str),
+        "price": np.round(rng.uniform(5, 50, n_products), 2),
+        "consumption_cycle_days": rng.choice(CYCLES, n_products),
+        "seasonality": rng.choice(SEASONS, n_products),
+        "is_pack": False,
+    })
+
+    # 2. Customers: order volume is heavy-tailed, like real shops
+    weights = rng.lognormal(0.0, 1.0, n_customers)
+    orders_per_customer = rng.multinomial(n_orders, weights / weights.sum())
+    routine = rng.integers(0, n_products, size=(n_customers, ROUTINE_SIZE))
+    cadence = products["consumption_cycle_days"].to_numpy()[routine[:, 0]]
+
+    # 3. Orders (sorted by customer). Each order sits one "gap" before the
+    # customer's next one; routine gaps follow the product cycle with jitter.
+    order_customer = np.repeat(np.arange(n_customers), orders_per_customer)
+    cust_cadence = cadence[order_customer]
+    random_gap = rng.exponential(span_days / np.maximum(orders_per_customer[order_customer], 1))
+    cycle_gap = cust_cadence * rng.normal(1.0, 0.15, n_orders)
+    is_routine = rng.random(n_orders) < cycle_realism
+    gaps = np.maximum(np.where(is_routine, cycle_gap, random_gap), 1.0)
+
+    # Exclusive cumulative sum of gaps within each customer's run of orders.
+    group_start = np.repeat(np.cumsum(orders_per_customer) - orders_per_customer, orders_per_customer)
+    before = np.cumsum(gaps) - gaps
+    offset = before - before[group_start] + rng.integers(0, cust_cadence)
+    offset = offset.astype(np.int64) % (span_days + 1)
+
+    orders = pd.DataFrame({
+        "order_id": _ids("ORD-", n_orders),
+        "customer_id": _ids("CUST-", n_customers).to_numpy()[order_customer],
+        "order_date": np.datetime64(end_date, "D") - offset.astype("timedelta64[D]"),
+    })
+
+    # 4. Line items: the first item of a routine order is the customer's main product
+    items_per_order = rng.integers(min_items, max_items + 1, n_orders)
+    item_order = np.repeat(np.arange(n_orders), items_per_order)
+    position = np.arange(len(item_order)) - np.repeat(np.cumsum(items_per_order) - items_per_order, items_per_order)
+    slot = np.where(position == 0, 0, rng.integers(0, ROUTINE_SIZE, len(item_order)))
+    from_routine = np.where(position == 0, is_routine[item_order], rng.random(len(item_order)) < cycle_realism)
+    product_idx = np.where(
+        from_routine,
+        routine[order_customer[item_order], slot],
+        rng.integers(0, n_products, len(item_order))
+    )
+    items = pd.DataFrame({
+        "order_idx": item_order,
+        "product_idx": product_idx,
+        "quantity": rng.integers(1, 3, len(item_order)),
+    }).drop_duplicates(["order_idx", "product_idx"])
+    items["order_id"] = orders["order_id"].to_numpy()[items["order_idx"].to_numpy()]
+    items["product_id"] = products["product_id"].to_numpy()[items["product_idx"].to_numpy()]
+
+    # 5. Customer aggregates, computed set-based instead of per order
+    items["value"] = items["quantity"] * products["price"].to_numpy()[items["product_idx"].to_numpy()]
+    order_totals = items.groupby("order_idx")["value"].sum().reindex(np.arange(n_orders), fill_value=0.0)
+    stats = pd.DataFrame({
+        "customer": order_customer,
+        "order_date": orders["order_date"],
+        "total": order_totals.to_numpy(),
+    }).groupby("customer").agg(
+        total_orders=("total", "size"),
+        total_spent=("total", "sum"),
+        first_purchase_date=("order_date", "min"),
+        last_purchase_date=("order_date", "max"),
+    ).reindex(np.arange(n_customers))
+    customers = pd.DataFrame({
+        "customer_id": _ids("CUST-", n_customers),
+        "email": "customer" + pd.Series(np.arange(1, n_customers + 1)).astype(str) + "@example.com",
+        "first_purchase_date": stats["first_purchase_date"].to_numpy(),
+        "last_purchase_date": stats["last_purchase_date"].to_numpy(),
+        "total_orders": stats["total_orders"].fillna(0).astype("int64").to_numpy(),
+        "total_spent": stats["total_spent"].fillna(0.0).to_numpy(),
+    })
+
+    with engine.begin() as conn:
+        if reset:
+            _reset(conn)
+        written = [
+            bulk_insert(Product.__table__, products, connection=conn),
+            bulk_insert(Customer.__table__, customers, connection=conn),
+            bulk_insert(Order.__table__, orders, connection=conn),
+            bulk_insert(OrderItem.__table__, items,
+                        columns=["order_id", "product_id", "quantity"], connection=conn),
+        ]
+    for stats_line in written:
+        print(f"    {stats_line}")
+    bump_dataset_version()
+
+    return {
+        "products": len(products),
+        "customers": len(customers),
+        "orders": len(orders),
+        "line_items": len(items),
+        "seconds": round(sum(w.seconds for w in written), 3),
+    }
+
+def create_mock_data(reset: bool = False, **params) -> Optional[dict]:
+    """
+    Populate the DB with synthetic history. Without `reset`, generation is
+    skipped if customers already exist. `params` go to generate_dataset.
+    """
     with Session(engine) as session:
         # Check if data exists
-        if session.exec(select(Customer)).first():
+        if not reset and session.exec(select(Customer)).first():
             print("Data already exists. Skipping mock generation.")
-            return
-
-        print("Generating mock data...")
-
-        # 1. Products
-        products = []
-        cycles = [30, 45, 60, 90]
-        seasons = ["all_year", "summer", "winter"]
-        for i in range(1, 21):
-            p = Product(
-                product_id=f"PROD-{i:03d}",
-                product_name=f"Product {i}",
-                consumption_cycle_days=random.choice(cycles),
-                seasonality=random.choice(seasons),
-                is_pack=False
-            )
-            session.add(p)
-            products.append(p)
-        session.commit()
-
-        # 2. Customers
-        customers = []
-        for i in range(1, 51):
-            c = Customer(
-                customer_id=f"CUST-{i:03d}",
-                email=f"customer{i}@example.com",
-                total_orders=0,
-                total_spent=0.0
-            )
-            session.add(c)
-            customers.append(c)
-        session.commit()
-
-        # 3. Orders (History: 4 years)
-        start_date = date.today() - timedelta(days=365*4)
-        orders = []
-        
-        for _ in range(500): # 500 random orders
-            cust = random.choice(customers)
-            # Random date in the last 4 years
-            days_offset = random.randint(0, 365*4)
-            order_date = start_date + timedelta(days=days_offset)
-            
-            order = Order(
-                order_id=str(uuid.uuid4()),
-                customer_id=cust.customer_id,
-                order_date=order_date
-            )
-            session.add(order)
-            
-            # Add line items
-            num_items = random.randint(1, 3)
-            current_products = random.sample(products, num_items)
-            order_total = 0
-            
-            for p in current_products:
-                qty = random.randint(1, 2)
-                item = OrderItem(
-                    order=order,
-                    product=p,
-                    quantity=qty
-                )
-                session.add(item)
-                order_total += qty * p.price
-            
-            # Update customer stats (naive)
-            cust.total_orders += 1
-            cust.total_spent += order_total
-            if not cust.first_purchase_date or order_date < cust.first_purchase_date:
-                cust.first_purchase_date = order_date
-            if not cust.last_purchase_date or order_date > cust.last_purchase_date:
-                cust.last_purchase_date = order_date
-            
-            session.add(cust)
-        
-        session.commit()
-        print("Mock data generated successfully.")
+            return None
+
+    print("Generating mock data...")
+    result = generate_dataset(reset=reset, **params)
+    print("Mock data generated successfully.")
+    return result
 
 if __name__ == "__main__":
     from app.core.db import create_db_and_tables
+    parser = argparse.ArgumentParser(description="Generate a synthetic order history.")
+    parser.add_argument("--customers", type=int, default=50)
+    parser.add_argument("--products", type=int, default=20)
+    parser.add_argument("--orders", type=int, default=500)
+    parser.add_argument("--min-items", type=int, default=1)
+    parser.add_argument("--max-items", type=int, default=3)
+    parser.add_argument("--span-days", type=int, default=365 * 4)
+    parser.add_argument("--end-date", type=date.fromisoformat, default=None)
+    parser.add_argument("--cycle-realism", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--reset", action="store_true", help="Delete existing data first")
+    args = parser.parse_args()
+
     create_db_and_tables()
-    create_mock_data()
+    print(create_mock_data(
+        reset=args.reset,
+        n_customers=args.customers,
+        n_products=args.products,
+        n_orders=args.orders,
+        min_items=args.min_items,
+        max_items=args.max_items,
+        span_days=args.span_days,
+        end_date=args.end_date,
+        cycle_realism=args.cycle_realism,
+        seed=args.seed,
+    ))
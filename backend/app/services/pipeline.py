@@ -0,0 +1,71 @@
+import time
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.metrics import PIPELINE_RUNS, track_stage
+from app.core.profiling import SamplingProfiler
+from app.services.rfm import run_rfm_analysis
+from app.services.recommendation import run_recommendation_engine
+from app.services.rollups import build_rollups
+from app.services.sharding import run_sharded_analysis
+
+# (stage name, zero-argument callable)
+Stage = Tuple[str, Callable[[], None]]
+
+def pipeline_stages(full_rebuild: bool, workers: int) -> List[Stage]:
+    if full_rebuild and workers > 1 and settings.RFM_ENGINE == "sql":
+        # The SQL engine aggregates inside the database in one statement;
+        # there is no per-shard pandas work to spread across processes.
+        print(f"RFM_ENGINE=sql: running the full rebuild unsharded (ignoring {workers} workers)")
+        workers = 1
+    if full_rebuild and workers > 1:
+        # RFM + recommendations per customer shard, in parallel processes
+        stages = [("sharded_analysis", lambda: run_sharded_analysis(workers))]
+    else:
+        stages = [
+            # 1. RFM
+            ("rfm", lambda: run_rfm_analysis(full_rebuild=full_rebuild)),
+            # 2. Recommendations
+            ("recommendations", lambda: run_recommendation_engine()),
+        ]
+    # Last: pre-aggregated counts of what was just published
+    return stages + [("rollups", build_rollups)]
+
+def run_pipeline(
+    full_rebuild: bool = False,
+    on_stage: Optional[Callable[[str, int, int, Dict[str, float]], None]] = None,
+    workers: Optional[int] = None,
+    profile_path: Optional[str] = None,
+) -> Dict[str, float]:
+    """
+    Run every analytics stage in order and return the seconds spent per stage.
+
+    `on_stage(name, index, total, timings)` is called before each stage starts;
+    `timings` is the live dict of completed stages. Full rebuilds run sharded
+    across `workers` processes (default settings.PIPELINE_WORKERS) when > 1,
+    unless RFM_ENGINE is "sql".
+    With `profile_path`, the run is sampled by SamplingProfiler and the folded
+    stacks are written there.
+    """
+    stages = pipeline_stages(full_rebuild, workers or settings.PIPELINE_WORKERS)
+    timings: Dict[str, float] = {}
+    profiler = SamplingProfiler(settings.PROFILE_INTERVAL_MS / 1000) if profile_path else None
+    try:
+        with profiler or nullcontext():
+            for index, (name, stage) in enumerate(stages):
+                if on_stage:
+                    on_stage(name, index, len(stages), timings)
+                start = time.perf_counter()
+                with track_stage(name, settings.METRICS_TRACE_MEMORY):
+                    stage()
+                timings[name] = round(time.perf_counter() - start, 4)
+    except Exception:
+        PIPELINE_RUNS.inc(outcome="failed")
+        raise
+    finally:
+        if profiler:
+            profiler.write(profile_path)
+            print(f"Pipeline profile ({profiler.samples} samples) written to {profile_path}")
+    # Cached reads were invalidated by each stage as it published.
+    PIPELINE_RUNS.inc(outcome="succeeded")
+    return timings
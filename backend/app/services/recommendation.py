@@ -1,99 +1,292 @@
-from datetime import date, timedelta
-from sqlmodel import Session, select
-from app.models.analysis import RFMProfile, Recommendation
-from app.models.product import Product
+import numpy as np
+import pandas as pd
+from datetime import date, datetime, timedelta
+from typing import Optional
+from sqlalchemy import text
+from sqlmodel import Session
+from app.models.analysis import Recommendation
+from app.core.config import settings
 from app.core.db import engine
-from app.services.explanation import generate_explanation
+from app.services.bulk import bulk_insert
+from app.services.explanation import TEMPLATE_DAY_WINDOWS, ExplanationPrompt, explain_many, get_backend
+from app.services.generations import (
+    active_generation, begin_generation, collect_garbage, publish_generation
+)
 
-def run_recommendation_engine():
-    print("Starting Recommendation Engine...")
+TABLE = "recommendation"
+RECOMMENDATION_COLUMNS = [
+    "customer_id", "product_id", "days_until_expected",
+    "recommended_contact_window", "confidence_level"
+]
+
+# Order of the checks matters: the first matching window wins, exactly like
+# the if/elif chain in compute_recommendations_loop.
+WINDOW_RULES = [
+    ("Early Reminder", lambda d: (d >= 0) & (d <= 5)),
+    ("On-time", lambda d: d == 0),
+    ("Follow-up (Late)", lambda d: (d < 0) & (d >= -7)),
+    ("Churn Risk / Win-back", lambda d: d < -7),
+]
+
+def current_season(today: date) -> str:
+    current_month = today.month
+    season = "all_year"
+    if current_month in [12, 1, 2]: season = "winter"
+    elif current_month in [6, 7, 8]: season = "summer"
+    return season
+
+def load_inputs(session: Session):
+    """Load RFM profiles and product cycle info as columnar DataFrames."""
+    conn = session.connection()
+    profiles = pd.read_sql(
+        text("SELECT customer_id, product_id, recency_days, frequency FROM rfmprofile "
+             "WHERE generation = :generation ORDER BY id"),
+        conn, params={"generation": active_generation(session, "rfmprofile")}
+    )
+    return profiles, load_products(session)
+
+def load_products(session: Session) -> pd.DataFrame:
+    return pd.read_sql(
+        "SELECT product_id, product_name, consumption_cycle_days, seasonality FROM product",
+        session.connection()
+    )
+
+def compute_recommendations_loop(profiles: pd.DataFrame, products: pd.DataFrame, today: date) -> pd.DataFrame:
+    """Reference engine: evaluates the rules one profile at a time."""
+    products_by_id = {p.product_id: p for p in products.itertuples(index=False)}
+    season = current_season(today)
+    rows = []
+
+    for profile in profiles.itertuples(index=False):
+        product = products_by_id.get(profile.product_id)
+        if not product: continue
+
+        # 1. Calc expected repurchase
+        # Last purchase was 'recency_days' ago
+        last_purchase_date = today - timedelta(days=int(profile.recency_days))
+        cycle = int(product.consumption_cycle_days)
+        expected_date = last_purchase_date + timedelta(days=cycle)
+
+        days_until_expected = (expected_date - today).days
+
+        # 2. Seasonality Check
+        # If product is seasonal and not current season, skip or delay
+        if product.seasonality != "all_year" and product.seasonality != season:
+            # Logic: If miss-matched season, don't recommend or mark 'Off-Season'
+            # Prompt said: "delay recommendation"
+            # We will just skip generating a "Contact" recommendation for now
+            continue
+
+        # 3. Generate Contact Window
+        # Early: -5 days (Target is within next 5 days)
+        # On-time: exact cycle (Target is today)
+        # Late: +7 days (Target was 7 days ago)
+        rec_window = ""
+        # If we are 5 days before expected date:
+        if 0 <= days_until_expected <= 5:
+            rec_window = "Early Reminder"
+        elif days_until_expected == 0:
+            rec_window = "On-time"
+        elif days_until_expected < 0 and days_until_expected >= -7:
+            rec_window = "Follow-up (Late)"
+        elif days_until_expected < -7:
+            rec_window = "Churn Risk / Win-back"
+        else:
+            # Too early to contact (> 5 days away)
+            continue
+
+        # 4. Assign Confidence
+        # High: Freq > 2 and Recency not too far off
+        # Medium: Freq == 2 or deviation
+        confidence = "low"
+        if profile.frequency >= 5:
+            confidence = "high"
+        elif profile.frequency >= 2:
+            confidence = "medium"
+
+        rows.append((profile.customer_id, profile.product_id, days_until_expected, rec_window, confidence))
+
+    return pd.DataFrame(rows, columns=RECOMMENDATION_COLUMNS).astype({"days_until_expected": "int64"})
+
+def compute_recommendations_vectorized(profiles: pd.DataFrame, products: pd.DataFrame, today: date) -> pd.DataFrame:
+    """Same rules as compute_recommendations_loop, evaluated over whole columns at once."""
+    # Inner merge keeps the left (profile) order, matching the loop's output order.
+    merged = profiles.merge(products, on="product_id", how="inner")
+
+    # expected_date - today == (today - recency + cycle) - today
+    days = (merged["consumption_cycle_days"].to_numpy(dtype=np.int64)
+            - merged["recency_days"].to_numpy(dtype=np.int64))
+
+    seasonality = merged["seasonality"].to_numpy()
+    in_season = (seasonality == "all_year") | (seasonality == current_season(today))
+
+    window = np.select(
+        [rule(days) for _, rule in WINDOW_RULES],
+        [name for name, _ in WINDOW_RULES],
+        default=""
+    )
+
+    frequency = merged["frequency"].to_numpy()
+    confidence = np.where(frequency >= 5, "high", np.where(frequency >= 2, "medium", "low"))
+
+    keep = in_season & (window != "")
+    return pd.DataFrame({
+        "customer_id": merged["customer_id"].to_numpy()[keep],
+        "product_id": merged["product_id"].to_numpy()[keep],
+        "days_until_expected": days[keep],
+        "recommended_contact_window": window[keep].astype(object),
+        "confidence_level": confidence[keep].astype(object),
+    }, columns=RECOMMENDATION_COLUMNS)
+
+ENGINES = {
+    "loop": compute_recommendations_loop,
+    "vectorized": compute_recommendations_vectorized,
+}
+
+EXPLANATION_KEYS = ["product_name", "recommended_contact_window", "confidence_level", "days_bucket"]
+
+def attach_reasoning(recs: pd.DataFrame, products: pd.DataFrame) -> pd.DataFrame:
+    """Fill the `reasoning` column for computed recommendations."""
+    # 5. Reasoning (LLM)
+    # Rows with the same salient inputs share one explanation, so only the
+    # distinct prompts go to the explainer.
+    keys = recs[["product_id", "recommended_contact_window", "confidence_level"]].merge(
+        products[["product_id", "product_name"]], on="product_id", how="left"
+    )
+    days = recs["days_until_expected"].to_numpy()
+    # Vectorized explanation.days_bucket
+    keys["days_bucket"] = np.where((days >= -7) & (days <= 5), days, (days // 7) * 7)
+    backend = get_backend()
+    if not backend.remote:
+        # The canned sentences of the other windows do not mention the days.
+        keys.loc[~keys["recommended_contact_window"].isin(TEMPLATE_DAY_WINDOWS), "days_bucket"] = 0
+
+    unique = keys[EXPLANATION_KEYS].drop_duplicates()
+    prompts = [
+        ExplanationPrompt(name, window, confidence, int(bucket))
+        for name, window, confidence, bucket in unique.itertuples(index=False, name=None)
+    ]
+    answers = explain_many(prompts, backend)
+    unique["reasoning"] = [answers[p] for p in prompts]
+
+    recs["reasoning"] = keys.merge(unique, on=EXPLANATION_KEYS, how="left")["reasoning"].to_numpy()
+    return recs
+
+# Diff of the staging generation against the published one, per pair. Each
+# statement appends in pair order; seq assigns the order within the run.
+CHANGE_LOG_INSERT = """
+INSERT INTO recommendationchange
+    (generation, change_type, customer_id, product_id, recommended_contact_window, confidence_level,
+     previous_contact_window, previous_confidence_level, changed_at)
+"""
+
+CHANGE_LOG_SQL = [
+    CHANGE_LOG_INSERT + """
+    SELECT n.generation, 'insert', n.customer_id, n.product_id, n.recommended_contact_window,
+           n.confidence_level, NULL, NULL, :now
+    FROM recommendation n
+    WHERE n.generation = :new AND NOT EXISTS (
+        SELECT 1 FROM recommendation o
+        WHERE o.generation = :old AND o.customer_id = n.customer_id AND o.product_id = n.product_id
+    )
+    ORDER BY n.customer_id, n.product_id
+    """,
+    CHANGE_LOG_INSERT + """
+    SELECT n.generation, 'update', n.customer_id, n.product_id, n.recommended_contact_window,
+           n.confidence_level, o.recommended_contact_window, o.confidence_level, :now
+    FROM recommendation n
+    JOIN recommendation o
+      ON o.generation = :old AND o.customer_id = n.customer_id AND o.product_id = n.product_id
+    WHERE n.generation = :new
+      AND (n.recommended_contact_window <> o.recommended_contact_window
+           OR n.confidence_level <> o.confidence_level)
+    ORDER BY n.customer_id, n.product_id
+    """,
+    CHANGE_LOG_INSERT + """
+    SELECT :new, 'delete', o.customer_id, o.product_id, NULL, NULL,
+           o.recommended_contact_window, o.confidence_level, :now
+    FROM recommendation o
+    WHERE o.generation = :old AND NOT EXISTS (
+        SELECT 1 FROM recommendation n
+        WHERE n.generation = :new AND n.customer_id = o.customer_id AND n.product_id = o.product_id
+    )
+    ORDER BY o.customer_id, o.product_id
+    """,
+]
+
+# A history reset deletes the published rows outside any pipeline run; logging
+# them as deletes keeps the feed a complete replay log.
+RESET_CHANGES_SQL = CHANGE_LOG_INSERT + """
+SELECT r.generation, 'delete', r.customer_id, r.product_id, NULL, NULL,
+       r.recommended_contact_window, r.confidence_level, :now
+FROM recommendation r
+WHERE r.generation = (SELECT CAST(value AS INTEGER) FROM pipelinestate WHERE key = :key)
+ORDER BY r.customer_id, r.product_id
+"""
+
+# Change-log writers (publishing recommendations, resetting history) hold
+# this transaction-scoped lock on PostgreSQL, so seq values are handed out in
+# commit order and a reader polling `since=` never passes a row that commits
+# later. SQLite already serialises writers on the database lock.
+CHANGE_LOG_LOCK_KEY = 0x52454343  # arbitrary, unique within the app ("RECC")
+
+def lock_change_log(conn) -> None:
+    """Block other change-log writers until the current transaction ends."""
+    if engine.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": CHANGE_LOG_LOCK_KEY})
+
+def record_changes(session: Session, old: int, new: int) -> int:
+    """Append the differences between generations `old` and `new` to the change log. Returns rows logged."""
+    params = {"old": old, "new": new, "now": datetime.utcnow()}
+    return sum(session.execute(text(statement), params).rowcount for statement in CHANGE_LOG_SQL)
+
+def record_reset(conn) -> int:
+    """Log the published recommendations as deleted; call in the transaction that resets history."""
+    lock_change_log(conn)
+    params = {"key": f"generation.{TABLE}", "now": datetime.utcnow()}
+    return conn.execute(text(RESET_CHANGES_SQL), params).rowcount
+
+def write_recommendations(recs: pd.DataFrame, today: date):
+    """
+    Replace the published recommendations with `recs`.
+
+    Rows go to a staging generation in short batches; readers switch to it in
+    one commit, together with the change-log entries for the switch, and the
+    previous generation is deleted afterwards.
+    """
+    staging = begin_generation(TABLE)
+    recs = recs.assign(generated_date=today, generation=staging)
+    stats = bulk_insert(
+        Recommendation.__table__, recs,
+        columns=["customer_id", "product_id", "recommended_contact_window",
+                 "confidence_level", "reasoning", "generated_date", "generation"]
+    )
     with Session(engine) as session:
-        # Get all RFM profiles
-        profiles = session.exec(select(RFMProfile)).all()
-        
-        # Get products for cycle info
-        products = {p.product_id: p for p in session.exec(select(Product)).all()}
-        
-        recommendations = []
-        session.query(Recommendation).delete() # Clear old recommendations
-        
-        today = date.today()
-        
-        for profile in profiles:
-            product = products.get(profile.product_id)
-            if not product: continue
-            
-            # 1. Calc expected repurchase
-            # Last purchase was 'recency_days' ago
-            last_purchase_date = today - timedelta(days=profile.recency_days)
-            cycle = product.consumption_cycle_days
-            expected_date = last_purchase_date + timedelta(days=cycle)
-            
-            days_until_expected = (expected_date - today).days
-            
-            # 2. Seasonality Check
-            current_month = today.month
-            season = "all_year"
-            if current_month in [12, 1, 2]: season = "winter"
-            elif current_month in [6, 7, 8]: season = "summer"
-            
-            # If product is seasonal and not current season, skip or delay
-            if product.seasonality != "all_year" and product.seasonality != season:
-                 # Logic: If miss-matched season, don't recommend or mark 'Off-Season'
-                 # Prompt said: "delay recommendation"
-                 # We will just skip generating a "Contact" recommendation for now
-                 continue
-            
-            # 3. Generate Contact Window
-            # Early: -5 days (Target is within next 5 days)
-            # On-time: exact cycle (Target is today)
-            # Late: +7 days (Target was 7 days ago)
-            
-            # Let's define "Recommended Window" logic based on prompt:
-            # "Predict WHEN... output is recommendated contact window"
-            
-            rec_window = ""
-            # If we are 5 days before expected date:
-            if 0 <= days_until_expected <= 5:
-                rec_window = "Early Reminder"
-            elif days_until_expected == 0:
-                rec_window = "On-time"
-            elif days_until_expected < 0 and days_until_expected >= -7:
-                rec_window = "Follow-up (Late)"
-            elif days_until_expected < -7:
-                rec_window = "Churn Risk / Win-back"
-            else:
-                # Too early to contact (> 5 days away)
-                continue
-
-            # 4. Assign Confidence
-            # High: Freq > 2 and Recency not too far off
-            # Medium: Freq == 2 or deviation
-            confidence = "low"
-            if profile.frequency >= 5:
-                confidence = "high"
-            elif profile.frequency >= 2:
-                confidence = "medium"
-                
-            # 5. Reasoning (LLM)
-            # We call the explainer here
-            explanation = generate_explanation(
-                customer_id=profile.customer_id,
-                product_name=product.product_name,
-                days_until_due=days_until_expected,
-                confidence=confidence,
-                window=rec_window
-            )
-            
-            rec = Recommendation(
-                customer_id=profile.customer_id,
-                product_id=profile.product_id,
-                recommended_contact_window=rec_window,
-                confidence_level=confidence,
-                reasoning=explanation
-            )
-            session.add(rec)
-            recommendations.append(rec)
-            
+        # Read the published generation under the lock, after any reset commits.
+        lock_change_log(session)
+        changes = record_changes(session, active_generation(session, TABLE), staging)
+        publish_generation(session, TABLE, staging)
         session.commit()
-        print(f"Generated {len(recommendations)} recommendations.")
+    print(f"    Logged {changes} recommendation changes")
+    collect_garbage(TABLE)
+    return stats
+
+def run_recommendation_engine(method: Optional[str] = None):
+    """
+    Rebuild the Recommendation table from the current RFM profiles.
+
+    `method` selects the rule engine ("vectorized" or "loop"); both produce
+    identical rows. Defaults to settings.RECOMMENDATION_ENGINE.
+    """
+    method = method or settings.RECOMMENDATION_ENGINE
+    print(f"Starting Recommendation Engine ({method})...")
+    with Session(engine) as session:
+        profiles, products = load_inputs(session)
+
+    today = date.today()
+    recs = ENGINES[method](profiles, products, today)
+    attach_reasoning(recs, products)
+
+    stats = write_recommendations(recs, today)
+    print(f"    {stats}")
+    print(f"Generated {len(recs)} recommendations.")
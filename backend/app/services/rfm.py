@@ -1,94 +1,527 @@
+import numpy as np
 import pandas as pd
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import text, func
 from sqlmodel import Session, select
 from app.models.customer import Customer
 from app.models.product import Product
 from app.models.order import Order, OrderItem
 from app.models.analysis import RFMProfile
+from app.core.config import settings
 from app.core.db import engine
+from app.core.metrics import ROWS_WRITTEN
+from app.services.bulk import bulk_insert
+from app.services.sketch import QuantileSketch, dump_sketches, load_sketches
+from app.services.generations import (
+    active_generation, begin_generation, collect_garbage, publish_generation
+)
+from app.services.snapshot import OrderFacts, product_prices, sync_snapshot
+from app.services.state import get_state, set_state
 
-def run_rfm_analysis():
-    print("Starting RFM Analysis...")
+# Persisted watermark: highest orderitem.id already folded into RFMProfile,
+# and the date the stored recency_days values are relative to.
+WATERMARK_KEY = "rfm.last_item_id"
+AS_OF_KEY = "rfm.as_of"
+SKETCHES_KEY = "rfm.sketches"
+TABLE = "rfmprofile"
+
+ORDER_LINES_QUERY = """
+SELECT
+    o.customer_id,
+    oi.product_id,
+    o.order_date,
+    oi.quantity,
+    p.price
+FROM orderitem oi
+JOIN "order" o ON oi.order_id = o.order_id
+JOIN product p ON oi.product_id = p.product_id
+"""
+
+# Customer-product pairs with line items past the watermark. Used to restrict
+# both the re-aggregation and the delete of stale profiles to those pairs.
+TOUCHED_PAIR_EXISTS = """
+EXISTS (
+    SELECT 1
+    FROM orderitem ni
+    JOIN "order" nord ON ni.order_id = nord.order_id
+    WHERE ni.id > :watermark
+      AND ni.id <= :high
+      AND nord.customer_id = {customer_col}
+      AND ni.product_id = {product_col}
+)
+"""
+
+PAIR_KEYS = ['customer_id', 'product_id']
+PROFILE_COLUMNS = ['customer_id', 'product_id', 'recency_days', 'frequency', 'monetary', 'segment', 'last_purchase_date']
+
+def segment_profiles(rfm: pd.DataFrame) -> pd.Series:
+    segment = pd.Series("Standard", index=rfm.index)
+    segment[rfm['frequency'] > 3] = "Loyal"
+    segment[rfm['recency_days'] > 100] = "At Risk"
+    return segment
+
+def day_numbers(values) -> np.ndarray:
+    """Dates (ISO strings on SQLite, date objects on PostgreSQL) as int32 days since 1970-01-01."""
+    return pd.to_datetime(values).to_numpy().astype('datetime64[D]').astype(np.int32)
+
+def type_order_lines(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compact raw order lines: categorical ids instead of one Python string per
+    row, int32 day numbers instead of date strings, int32 quantities.
+    """
+    return pd.DataFrame({
+        'customer_id': df['customer_id'].astype('category'),
+        'product_id': df['product_id'].astype('category'),
+        'order_day': day_numbers(df['order_date']),
+        'quantity': df['quantity'].to_numpy(dtype=np.int32),
+        'price': df['price'].to_numpy(dtype=np.float64),
+    })
+
+# Quintile scoring needs global quantiles, which no chunk, shard or
+# incremental run sees in full. Each metric is summarised in a mergeable
+# sketch instead: built from the profiles a run writes, merged across shards,
+# persisted with the published generation and updated by later runs with the
+# profiles they replace (removed) and write (added). Recency is sketched as
+# the last purchase day, which does not change as time passes, so carried-over
+# profiles need no update. R and F cut points are exact; M cut points are
+# within RFM_SKETCH_ACCURACY (relative) of the exact quintiles.
+SCORE_TILES = 5
+
+def new_sketches() -> Dict[str, QuantileSketch]:
+    return {
+        'recency': QuantileSketch(0),
+        'frequency': QuantileSketch(0),
+        'monetary': QuantileSketch(settings.RFM_SKETCH_ACCURACY),
+    }
+
+def sketch_values(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """The sketched value of each metric, oriented so that higher scores better."""
+    return {
+        'recency': day_numbers(df['last_purchase_date']),
+        'frequency': df['frequency'].to_numpy(dtype=np.int64),
+        'monetary': df['monetary'].to_numpy(dtype=np.float64),
+    }
+
+def update_sketches(sketches: Dict[str, QuantileSketch], df: pd.DataFrame, weight: int = 1) -> Dict[str, QuantileSketch]:
+    for name, values in sketch_values(df).items():
+        sketches[name].add(values, weight)
+    return sketches
+
+def score_cuts(sketches: Dict[str, QuantileSketch]) -> Optional[Dict[str, List[float]]]:
+    """Quintile cut points per metric, or None if no profiles were sketched."""
+    cuts = {name: sketch.quantiles(SCORE_TILES) for name, sketch in sketches.items()}
+    return None if cuts['frequency'] is None else cuts
+
+def score_profiles(rfm: pd.DataFrame, cuts: Dict[str, List[float]]) -> pd.Series:
+    """R, F and M quintiles (1-5, 5 best) as "RFM" strings, e.g. "535"."""
+    score = np.zeros(len(rfm), dtype=np.int64)
+    for name, values in sketch_values(rfm).items():
+        tier = np.ones(len(rfm), dtype=np.int64)
+        for cut in cuts[name]:
+            tier += values > cut
+        score = score * 10 + tier
+    return pd.Series(score, index=rfm.index).astype(str)
+
+# score_profiles in SQL, over rfmprofile columns; parameters from score_params.
+def _tier_sql(column: str, prefix: str) -> str:
+    whens = " ".join(
+        f"WHEN {column} > :{prefix}{k} THEN '{k + 2}'" for k in reversed(range(SCORE_TILES - 1))
+    )
+    return f"(CASE {whens} ELSE '1' END)"
+
+SCORE_SQL = " || ".join(
+    _tier_sql(column, prefix)
+    for column, prefix in (("last_purchase_date", "r"), ("frequency", "f"), ("monetary", "m"))
+)
+
+def score_params(cuts: Dict[str, List[float]]) -> dict:
+    epoch = date(1970, 1, 1)
+    params = {}
+    for k in range(SCORE_TILES - 1):
+        params[f"r{k}"] = (epoch + timedelta(days=int(cuts['recency'][k]))).isoformat()
+        params[f"f{k}"] = cuts['frequency'][k]
+        params[f"m{k}"] = cuts['monetary'][k]
+    return params
+
+def footprint(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum())
+
+def report_footprint(rows: int, raw: int, typed: int) -> None:
+    print(f"    Order lines: {rows} rows, {raw / 2**20:.1f} MB as loaded -> {typed / 2**20:.1f} MB typed")
+
+def aggregate_chunk(df: pd.DataFrame) -> pd.DataFrame:
+    """Reduce a batch of typed order lines to per-pair partial aggregates."""
+    df = df.assign(total_value=df['quantity'] * df['price'])
+
+    # Group by Customer + Product; built-in reducers only
+    agg = df.groupby(PAIR_KEYS, observed=True).agg(
+        last_order_day=('order_day', 'max'),
+        frequency=('quantity', 'count'), # Frequency (count of orders/items)
+        monetary=('total_value', 'sum') # Monetary
+    )
+    # Plain string keys again, so partials from chunks with different
+    # categories fold together.
+    agg.index = pd.MultiIndex.from_arrays(
+        [agg.index.get_level_values(key).astype(object) for key in PAIR_KEYS], names=PAIR_KEYS
+    )
+    return agg
+
+def fold_aggregates(running: Optional[pd.DataFrame], partial: pd.DataFrame) -> pd.DataFrame:
+    """Merge two partial aggregates; max/count/sum are all associative."""
+    if running is None:
+        return partial
+    combined = pd.concat([running, partial])
+    return combined.groupby(level=PAIR_KEYS).agg(
+        last_order_day=('last_order_day', 'max'),
+        frequency=('frequency', 'sum'),
+        monetary=('monetary', 'sum')
+    )
+
+def finalize_rfm(agg: pd.DataFrame, today: date) -> pd.DataFrame:
+    """Turn folded aggregates into RFMProfile-shaped rows."""
+    rfm = agg.reset_index()
+    # One reference day for every pair
+    last_day = rfm['last_order_day'].to_numpy(dtype=np.int64)
+    rfm['recency_days'] = np.datetime64(today, 'D').astype(np.int64) - last_day # Recency
+    rfm['frequency'] = rfm['frequency'].astype('int64')
+    rfm['segment'] = segment_profiles(rfm)
+    rfm['last_purchase_date'] = last_day.astype('datetime64[D]').astype('datetime64[ns]')
+    return rfm[PROFILE_COLUMNS]
+
+def aggregate_rfm(df: pd.DataFrame, today: date) -> pd.DataFrame:
+    """Group typed order lines by customer + product into recency/frequency/monetary."""
+    return finalize_rfm(aggregate_chunk(df), today)
+
+def stream_aggregate(query: str, params: dict, today: date, chunk_size: int) -> Optional[pd.DataFrame]:
+    """
+    Aggregate the order lines returned by `query` while holding at most
+    `chunk_size` raw lines in memory; the running state is one row per pair.
+    Returns None if the query produced no rows.
+    """
+    running = None
+    rows = raw = typed = 0
+    # stream_results makes PostgreSQL use a server-side cursor instead of
+    # buffering the whole result set client-side.
+    with engine.connect().execution_options(stream_results=True) as conn:
+        for chunk in pd.read_sql(text(query), conn, params=params, chunksize=chunk_size):
+            if chunk.empty:
+                continue
+            lines = type_order_lines(chunk)
+            rows, raw, typed = rows + len(chunk), raw + footprint(chunk), typed + footprint(lines)
+            del chunk
+            running = fold_aggregates(running, aggregate_chunk(lines))
+    if running is None:
+        return None
+    report_footprint(rows, raw, typed)
+    return finalize_rfm(running, today)
+
+def compute_rfm(query: str, params: dict, today: date) -> Optional[pd.DataFrame]:
+    """Aggregate the lines selected by `query`, streaming if RFM_CHUNK_SIZE is set."""
+    if settings.RFM_CHUNK_SIZE > 0:
+        return stream_aggregate(query, params, today, settings.RFM_CHUNK_SIZE)
+    df = pd.read_sql(text(query), engine, params=params)
+    if df.empty:
+        return None
+    lines = type_order_lines(df)
+    report_footprint(len(df), footprint(df), footprint(lines))
+    del df
+    return aggregate_rfm(lines, today)
+
+def aggregate_snapshot(
+    facts: OrderFacts,
+    today: date,
+    high: int,
+    watermark: Optional[int] = None,
+    rows: Optional[np.ndarray] = None,
+) -> Optional[pd.DataFrame]:
+    """
+    compute_rfm over the columnar order snapshot instead of SQL; same rows,
+    same order. Only lines with item id <= `high` count. With `watermark`,
+    only the pairs with lines past it are aggregated (over their whole
+    history), like the incremental query. `rows` optionally masks lines
+    (e.g. one customer shard).
+    """
+    end = facts.rows_after(high)
+    mask = np.zeros(len(facts), dtype=bool)
+    mask[:end] = True
+    if rows is not None:
+        mask &= rows
+    prices = product_prices(facts.product_ids)
+    # Inner join semantics: lines of products missing from the catalogue drop out.
+    mask &= ~np.isnan(prices)[facts.product]
+
+    n_products = max(len(facts.product_ids), 1)
+    pair = facts.customer.astype(np.int64) * n_products + facts.product
+    if watermark is not None:
+        new = np.zeros(len(facts), dtype=bool)
+        new[facts.rows_after(watermark):end] = True
+        mask &= np.isin(pair, pair[mask & new])
+
+    pair, day = pair[mask], facts.day[mask]
+    if not len(pair):
+        return None
+    value = facts.quantity[mask] * prices[facts.product[mask]]
+
+    # Sorted by pair then day, the last line of each run has the latest order.
+    order = np.lexsort((day, pair))
+    pair = pair[order]
+    last = np.r_[np.flatnonzero(pair[1:] != pair[:-1]), len(pair) - 1]
+    first = np.r_[0, last[:-1] + 1]
+    keys = pair[last]
+    agg = pd.DataFrame({
+        'customer_id': facts.customer_ids[keys // n_products],
+        'product_id': facts.product_ids[keys % n_products],
+        'last_order_day': day[order][last],
+        'frequency': last - first + 1,
+        'monetary': np.add.reduceat(value[order], first),
+    }).set_index(PAIR_KEYS).sort_index()
+    return finalize_rfm(agg, today)
+
+def with_due_dates(rfm: pd.DataFrame) -> pd.DataFrame:
+    """Add expected_repurchase_date = last purchase + the product's consumption cycle."""
+    cycles = pd.read_sql("SELECT product_id, consumption_cycle_days FROM product", engine)
+    cycle = rfm[['product_id']].merge(cycles, on='product_id', how='left')['consumption_cycle_days']
+    return rfm.assign(
+        expected_repurchase_date=rfm['last_purchase_date'] + pd.to_timedelta(cycle.to_numpy(), unit='D')
+    )
+
+def write_profiles(rfm: pd.DataFrame, generation: int):
+    """Append scored RFM rows to the staging `generation` in short batched transactions."""
+    rfm = with_due_dates(rfm).assign(generation=generation)
+    return bulk_insert(
+        RFMProfile.__table__, rfm,
+        columns=PROFILE_COLUMNS + ['rfm_score', 'expected_repurchase_date', 'generation']
+    )
+
+PROFILE_VALUES_QUERY = """
+SELECT last_purchase_date, frequency, monetary FROM rfmprofile WHERE generation = :generation
+"""
+
+def sketch_profiles(sketches: Dict[str, QuantileSketch], generation: int,
+                    touched: Optional[dict] = None, weight: int = 1) -> None:
+    """Add (or with weight=-1 remove) the stored profiles of `generation`, optionally only the touched pairs."""
+    query, params = PROFILE_VALUES_QUERY, {"generation": generation}
+    if touched:
+        query += "AND " + TOUCHED_PAIR_EXISTS.format(
+            customer_col="rfmprofile.customer_id", product_col="rfmprofile.product_id"
+        )
+        params.update(touched)
+    with engine.connect().execution_options(stream_results=True) as conn:
+        for chunk in pd.read_sql(text(query), conn, params=params,
+                                 chunksize=max(settings.RFM_CHUNK_SIZE, settings.BULK_BATCH_SIZE)):
+            update_sketches(sketches, chunk, weight)
+
+def score_staged(staging: int, cuts: Dict[str, List[float]]) -> int:
+    """Score the rows already in `staging` (written by the SQL engine) in the database."""
+    with engine.begin() as conn:
+        return conn.execute(
+            text(f"UPDATE rfmprofile SET rfm_score = {SCORE_SQL} WHERE generation = :staging"),
+            {"staging": staging, **score_params(cuts)}
+        ).rowcount
+
+# Carries unchanged profiles into the staging generation, aged by :shift days.
+# Recency only grows, so the only segment that can change is "At Risk"; the
+# purchase and due dates are absolute and carried as they are. Scores are
+# recomputed: the quintile cut points move with every run.
+COPY_FORWARD_SQL = """
+INSERT INTO rfmprofile (customer_id, product_id, recency_days, frequency, monetary, segment, rfm_score,
+                        last_purchase_date, expected_repurchase_date, generation)
+SELECT customer_id, product_id, recency_days + :shift, frequency, monetary,
+       CASE WHEN recency_days + :shift > 100 THEN 'At Risk' ELSE segment END,
+       {score},
+       last_purchase_date, expected_repurchase_date,
+       :staging
+FROM rfmprofile
+WHERE generation = :active AND id > :lo AND id <= :hi
+"""
+
+def _copy_forward(active: int, staging: int, shift: int, exclude_touched: Optional[dict],
+                  cuts: Dict[str, List[float]]) -> int:
+    """Copy the active generation into `staging` in id-range batches; returns rows copied."""
+    query = COPY_FORWARD_SQL.format(score=SCORE_SQL)
+    params = {"active": active, "staging": staging, "shift": max(shift, 0), **score_params(cuts)}
+    if exclude_touched:
+        query += "AND NOT " + TOUCHED_PAIR_EXISTS.format(
+            customer_col="rfmprofile.customer_id", product_col="rfmprofile.product_id"
+        )
+        params.update(exclude_touched)
     with Session(engine) as session:
-        # Load data into DataFrame
-        # We need a join of OrderItem -> Order -> Product
-        # SQL: select * from orderitem join order on ...
-        
-        statement = select(
-            models.OrderItem.quantity,
-            models.Order.customer_id,
-            models.Order.order_date,
-            Product.product_id,
-            Product.price
-        ).join(models.Order).join(Product)
-        
-        # SQLModel doesn't execute join to dict easily for pandas without iteration, 
-        # but pandas read_sql is easier if we have the connection.
-        # Let's use pandas read_sql with the engine.
-        
-        query = """
-        SELECT 
-            o.customer_id, 
-            oi.product_id, 
-            o.order_date, 
-            oi.quantity,
-            p.price
-        FROM orderitem oi
-        JOIN "order" o ON oi.order_id = o.order_id
-        JOIN product p ON oi.product_id = p.product_id
-        """
-        
-        try:
-            df = pd.read_sql(query, engine)
-        except Exception as e:
-            print(f"Error loading data: {e}")
-            return
-            
-        if df.empty:
-            print("No data to analyze.")
-            return
-
-        # Ensure datetime
-        df['order_date'] = pd.to_datetime(df['order_date'])
-        df['total_value'] = df['quantity'] * df['price']
-        
-        # Group by Customer + Product
-        rfm = df.groupby(['customer_id', 'product_id']).agg({
-            'order_date': lambda x: (pd.Timestamp.now() - x.max()).days, # Recency
-            'quantity': 'count', # Frequency (count of orders/items)
-            'total_value': 'sum' # Monetary
-        }).reset_index()
-        
-        rfm.rename(columns={
-            'order_date': 'recency_days', 
-            'quantity': 'frequency', 
-            'total_value': 'monetary'
-        }, inplace=True)
-        
-        # Save to DB
-        # First, clear old profiles? Or update? For MVP, clear old.
-        session.query(RFMProfile).delete()
-        
-        profiles = []
-        for _, row in rfm.iterrows():
-            # Basic scoring (1-5 scale logic could go here, for now just store raw)
-            # Example "score" string logic
-            score_str = "Standard"
-            if row['frequency'] > 3: score_str = "Loyal"
-            if row['recency_days'] > 100: score_str = "At Risk"
-            
-            profile = RFMProfile(
-                customer_id=row['customer_id'],
-                product_id=row['product_id'],
-                recency_days=int(row['recency_days']),
-                frequency=int(row['frequency']),
-                monetary=float(row['monetary']),
-                rfm_score=score_str
-            )
-            session.add(profile)
-        
+        lo, hi = session.execute(
+            text("SELECT MIN(id), MAX(id) FROM rfmprofile WHERE generation = :active"),
+            {"active": active}
+        ).one()
+    if lo is None:
+        return 0
+    copied = 0
+    batch = settings.BULK_BATCH_SIZE
+    for start in range(lo - 1, hi, batch):
+        with engine.begin() as conn:
+            copied += conn.execute(text(query), {**params, "lo": start, "hi": start + batch}).rowcount
+    ROWS_WRITTEN.inc(copied, table=TABLE)
+    return copied
+
+# SQL pushdown engine: the same aggregation and segments as the pandas path in
+# one GROUP BY, written with INSERT ... SELECT so no row passes through Python.
+# Rows are inserted in (customer_id, product_id) byte order, the order the
+# pandas groupby produces. Scores are filled in by score_staged once the run's
+# sketches include these rows.
+PUSHDOWN_SQL = """
+INSERT INTO rfmprofile (customer_id, product_id, recency_days, frequency, monetary, segment, rfm_score,
+                        last_purchase_date, expected_repurchase_date, generation)
+SELECT customer_id, product_id, recency_days, frequency, monetary,
+       CASE WHEN recency_days > 100 THEN 'At Risk'
+            WHEN frequency > 3 THEN 'Loyal'
+            ELSE 'Standard' END,
+       '',
+       last_purchase_date, {expected_date}, :staging
+FROM (
+    SELECT o.customer_id,
+           oi.product_id,
+           {recency_days} AS recency_days,
+           COUNT(oi.quantity) AS frequency,
+           SUM(oi.quantity * p.price) AS monetary,
+           MAX(o.order_date) AS last_purchase_date,
+           MAX(p.consumption_cycle_days) AS cycle_days
+    FROM orderitem oi
+    JOIN "order" o ON oi.order_id = o.order_id
+    JOIN product p ON oi.product_id = p.product_id
+    {where}
+    GROUP BY o.customer_id, oi.product_id
+) agg
+ORDER BY {order_by}
+"""
+
+PUSHDOWN_DIALECTS = {
+    "sqlite": dict(
+        recency_days="CAST(julianday(:today) - julianday(MAX(o.order_date)) AS INTEGER)",
+        expected_date="date(last_purchase_date, '+' || cycle_days || ' days')",
+        order_by="customer_id, product_id",
+    ),
+    "postgresql": dict(
+        recency_days="(CAST(:today AS DATE) - MAX(o.order_date))",
+        expected_date="last_purchase_date + cycle_days",
+        order_by='customer_id COLLATE "C", product_id COLLATE "C"',
+    ),
+}
+
+def pushdown_rfm(staging: int, today: date, touched: Optional[dict] = None) -> int:
+    """
+    Aggregate and write RFM profiles into `staging` inside the database.
+    With `touched` ({"watermark", "high"}) only the changed pairs are
+    recomputed, like the incremental pandas query. Returns rows written.
+    """
+    dialect = PUSHDOWN_DIALECTS.get(engine.dialect.name)
+    if dialect is None:
+        raise ValueError(f"SQL RFM engine does not support {engine.dialect.name}")
+    where = ""
+    params = {"staging": staging, "today": today.isoformat()}
+    if touched:
+        where = "WHERE " + TOUCHED_PAIR_EXISTS.format(customer_col="o.customer_id", product_col="oi.product_id")
+        params.update(touched)
+    with engine.begin() as conn:
+        written = conn.execute(text(PUSHDOWN_SQL.format(where=where, **dialect)), params).rowcount
+    ROWS_WRITTEN.inc(written, table=TABLE)
+    return written
+
+def max_order_item_id(session: Session) -> int:
+    return session.exec(select(func.max(OrderItem.id))).one() or 0
+
+def publish_profiles(staging: int, high: int, today: date, sketches: Dict[str, QuantileSketch]) -> None:
+    """Make `staging` the visible RFM generation; the watermark and sketches move in the same commit."""
+    with Session(engine) as session:
+        publish_generation(session, TABLE, staging)
+        set_state(session, WATERMARK_KEY, high)
+        set_state(session, AS_OF_KEY, today.isoformat())
+        set_state(session, SKETCHES_KEY, dump_sketches(sketches))
         session.commit()
-        print(f"RFM Analysis complete. Generated {len(rfm)} profiles.")
+    collect_garbage(TABLE)
+
+def run_rfm_analysis(full_rebuild: bool = False):
+    """
+    Compute RFMProfile rows per customer-product pair.
+
+    By default only the pairs touched by order items newer than the persisted
+    watermark are re-aggregated; every other profile is carried over with its
+    recency moved forward by the days elapsed since the previous run.
+    `full_rebuild=True` (or a missing/invalid watermark) recomputes everything.
+    Every profile is (re)scored against the updated quintile sketches.
+
+    Rows are written to a staging generation and published atomically at the
+    end, so readers keep seeing the previous complete result meanwhile.
+    """
+    print("Starting RFM Analysis...")
+    today = date.today()
+    with Session(engine) as session:
+        # Capture the high-water mark before reading so lines inserted while we
+        # run are picked up by the next run instead of being skipped.
+        high = max_order_item_id(session)
+        watermark = int(get_state(session, WATERMARK_KEY, "-1"))
+        as_of = get_state(session, AS_OF_KEY)
+        active = active_generation(session, TABLE)
+        sketches = load_sketches(get_state(session, SKETCHES_KEY))
+
+    # Order items are append-only; a lower max id means the history was reset.
+    if watermark < 0 or as_of is None or sketches is None or high < watermark:
+        full_rebuild = True
+    if full_rebuild:
+        sketches = new_sketches()
+
+    # Load data into DataFrame
+    # We need a join of OrderItem -> Order -> Product
+    touched = {"watermark": watermark, "high": high}
+    rfm = None
+    staging = None
+    written = 0
+    if full_rebuild:
+        query, params = ORDER_LINES_QUERY, {}
+    else:
+        query = ORDER_LINES_QUERY + "WHERE " + TOUCHED_PAIR_EXISTS.format(
+            customer_col="o.customer_id", product_col="oi.product_id"
+        )
+        params = touched
+
+    # Failures propagate so the pipeline run and its job are reported failed;
+    # only an empty history returns early below.
+    if full_rebuild or high > watermark:
+        if settings.RFM_ENGINE == "sql":
+            staging = begin_generation(TABLE)
+            written = pushdown_rfm(staging, today, None if full_rebuild else touched)
+            print(f"    Wrote {written} profiles in the database (SQL engine)")
+        elif settings.ANALYTICS_SOURCE == "snapshot":
+            rfm = aggregate_snapshot(sync_snapshot(), today, high, None if full_rebuild else watermark)
+        else:
+            rfm = compute_rfm(query, params, today)
+
+    if rfm is None and not written and full_rebuild:
+        print("No data to analyze.")
+        return
+
+    # The recomputed pairs' previous profiles leave the distribution, their
+    # new ones join it.
+    if not full_rebuild and high > watermark:
+        sketch_profiles(sketches, active, touched, weight=-1)
+    if rfm is not None:
+        update_sketches(sketches, rfm)
+    elif written:
+        sketch_profiles(sketches, staging)
+    cuts = score_cuts(sketches)
+
+    # Save to DB
+    if staging is None:
+        staging = begin_generation(TABLE)
+    if rfm is not None:
+        stats = write_profiles(rfm.assign(rfm_score=score_profiles(rfm, cuts)), staging)
+        written = stats.rows
+        print(f"    {stats}")
+    elif written:
+        score_staged(staging, cuts)
+    carried = 0
+    if not full_rebuild and cuts is not None:
+        shift = (today - date.fromisoformat(as_of)).days
+        carried = _copy_forward(active, staging, shift, touched if high > watermark else None, cuts)
+
+    publish_profiles(staging, high, today, sketches)
 
-# Helper to fix module reference in string query if needed
-import app.models.order as models
-import app.models.product as p_models
+    mode = "full rebuild" if full_rebuild else f"incremental, {carried} carried over"
+    print(f"RFM Analysis complete ({mode}). Generated {written} profiles.")
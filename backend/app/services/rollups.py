@@ -0,0 +1,88 @@
+from collections import defaultdict
+from typing import Optional
+from sqlalchemy import func, text
+from sqlmodel import Session, select
+from app.core.db import engine
+from app.models.analysis import RecommendationRollup, SegmentRollup
+from app.services.cache import advance_dataset_version
+from app.services.generations import active_generation
+
+# Headline numbers are pre-aggregated once per pipeline run, DB-side, for the
+# published generations. Readers take the newest rollup generation, so the
+# summary costs the same whether there are a thousand or ten million rows.
+
+URGENT_WINDOWS = ["Early Reminder", "On-time"]
+
+RECOMMENDATION_ROLLUP_SQL = """
+INSERT INTO recommendationrollup
+    (generation, recommended_contact_window, confidence_level, product_id, seasonality, recommendations)
+SELECT r.generation, r.recommended_contact_window, r.confidence_level, r.product_id,
+       COALESCE(p.seasonality, 'unknown'), COUNT(*)
+FROM recommendation r
+LEFT JOIN product p ON p.product_id = r.product_id
+WHERE r.generation = :generation
+GROUP BY r.generation, r.recommended_contact_window, r.confidence_level, r.product_id, p.seasonality
+"""
+
+SEGMENT_ROLLUP_SQL = """
+INSERT INTO segmentrollup (generation, segment, profiles, monetary)
+SELECT generation, segment, COUNT(*), COALESCE(SUM(monetary), 0)
+FROM rfmprofile
+WHERE generation = :generation
+GROUP BY generation, segment
+"""
+
+def build_rollups() -> None:
+    """Rebuild the rollups of the published generations in one transaction."""
+    with Session(engine) as session:
+        generations = {
+            "recommendationrollup": (RECOMMENDATION_ROLLUP_SQL, active_generation(session, "recommendation")),
+            "segmentrollup": (SEGMENT_ROLLUP_SQL, active_generation(session, "rfmprofile")),
+        }
+    # Readers switch from the old rollup rows to the new ones at commit.
+    with Session(engine) as session:
+        for table, (query, generation) in generations.items():
+            session.execute(text(f"DELETE FROM {table} WHERE generation <= :generation"), {"generation": generation})
+            session.execute(text(query), {"generation": generation})
+        advance_dataset_version(session)
+        session.commit()
+    print("Rollups rebuilt.")
+
+def _latest(session: Session, model) -> Optional[int]:
+    return session.exec(select(func.max(model.generation))).one()
+
+def load_summary(session: Session) -> dict:
+    """Headline metrics and chart breakdowns from the rollup tables."""
+    generation = _latest(session, RecommendationRollup)
+    rows = session.exec(
+        select(RecommendationRollup).where(RecommendationRollup.generation == generation)
+    ).all() if generation is not None else []
+
+    by_window_confidence = defaultdict(int)
+    by_product = defaultdict(int)
+    by_seasonality = defaultdict(int)
+    for row in rows:
+        by_window_confidence[(row.recommended_contact_window, row.confidence_level)] += row.recommendations
+        by_product[row.product_id] += row.recommendations
+        by_seasonality[row.seasonality] += row.recommendations
+
+    segment_generation = _latest(session, SegmentRollup)
+    segments = session.exec(
+        select(SegmentRollup).where(SegmentRollup.generation == segment_generation)
+    ).all() if segment_generation is not None else []
+
+    return {
+        "generation": generation,
+        "total": sum(by_window_confidence.values()),
+        "high_confidence": sum(n for (_, confidence), n in by_window_confidence.items() if confidence == "high"),
+        "urgent": sum(n for (window, _), n in by_window_confidence.items() if window in URGENT_WINDOWS),
+        "by_window_confidence": [
+            {"window": window, "confidence": confidence, "count": n}
+            for (window, confidence), n in sorted(by_window_confidence.items())
+        ],
+        "by_product": dict(sorted(by_product.items())),
+        "by_seasonality": dict(sorted(by_seasonality.items())),
+        "profiles_generation": segment_generation,
+        "segments": {row.segment: {"profiles": row.profiles, "monetary": row.monetary} for row in segments},
+        "monetary_total": sum(row.monetary for row in segments),
+    }
@@ -0,0 +1,269 @@
+import sys
+import threading
+import time
+from array import array
+from datetime import date
+from typing import Dict, List, Optional
+from sqlalchemy import text
+from sqlmodel import Session
+from app.core.config import settings
+from app.core.db import engine
+from app.services.cache import dataset_version
+from app.services.generations import active_generation
+
+# Published recommendations and RFM profiles held in the API process as
+# array-backed columns: one machine value per field per row instead of one
+# ORM object per row. Strings are interned into per-column tables, rows are
+# sorted by customer and a CSR-style offset array gives each customer's
+# slice, so a lookup is two index reads and a slice.
+#
+# The store is tagged with the dataset version it was loaded at. When the
+# version moves (pipeline run, ingestion), readers get None and fall back to
+# the DB while a background thread builds the new store, which then replaces
+# the old one with a single reference swap.
+
+class _Interner:
+    def __init__(self):
+        self.values: List[Optional[str]] = []
+        self.codes: Dict[Optional[str], int] = {}
+
+    def code(self, value: Optional[str]) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def nbytes(self) -> int:
+        return sum(sys.getsizeof(v) for v in self.values) + sys.getsizeof(self.codes)
+
+def _ordinal(value) -> int:
+    # 0 encodes NULL (date.toordinal() starts at 1).
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    return value.toordinal()
+
+def _date(ordinal: int) -> Optional[date]:
+    return date.fromordinal(ordinal) if ordinal else None
+
+class _Table:
+    """Columns of one table plus the per-customer offsets into them."""
+
+    def __init__(self, typecodes: Dict[str, str]):
+        self.columns = {name: array(typecode) for name, typecode in typecodes.items()}
+        self.offsets = array("q")
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values())))
+
+    def index(self, customer_codes: array, n_customers: int) -> None:
+        counts = array("q", bytes(8 * (n_customers + 1)))
+        for code in customer_codes:
+            counts[code + 1] += 1
+        for i in range(1, len(counts)):
+            counts[i] += counts[i - 1]
+        self.offsets = counts
+
+    def nbytes(self) -> int:
+        arrays = [*self.columns.values(), self.offsets]
+        return sum(a.buffer_info()[1] * a.itemsize for a in arrays)
+
+RECOMMENDATIONS_QUERY = """
+SELECT id, customer_id, product_id, recommended_contact_window, confidence_level, reasoning, generated_date
+FROM recommendation WHERE generation = :generation
+ORDER BY customer_id, id
+"""
+
+PROFILES_QUERY = """
+SELECT customer_id, product_id, recency_days, frequency, monetary, rfm_score, segment,
+       last_purchase_date, expected_repurchase_date
+FROM rfmprofile WHERE generation = :generation
+ORDER BY customer_id, id
+"""
+
+# Both tables are read in the same customer order, so interning the union
+# first makes customer codes ascend with the rows of each table.
+CUSTOMERS_QUERY = """
+SELECT customer_id FROM recommendation WHERE generation = :recommendations
+UNION
+SELECT customer_id FROM rfmprofile WHERE generation = :profiles
+ORDER BY 1
+"""
+
+class ServingStore:
+    def __init__(self, version: int, generations: Dict[str, int]):
+        self.version = version
+        self.generations = generations
+        self.loaded_at = time.time()
+        self.load_seconds = 0.0
+        self.customers = _Interner()
+        self.strings = {name: _Interner() for name in ("product", "window", "confidence", "reasoning", "score", "segment")}
+        self.recommendations = _Table({
+            "id": "q", "customer": "i", "product": "i", "window": "i", "confidence": "i",
+            "reasoning": "i", "generated_date": "i",
+        })
+        self.profiles = _Table({
+            "customer": "i", "product": "i", "recency_days": "i", "frequency": "i", "monetary": "d",
+            "score": "i", "segment": "i", "last_purchase_date": "i", "expected_repurchase_date": "i",
+        })
+
+    @property
+    def rows(self) -> int:
+        return len(self.recommendations) + len(self.profiles)
+
+    def nbytes(self) -> int:
+        interned = [self.customers, *self.strings.values()]
+        return (self.recommendations.nbytes() + self.profiles.nbytes()
+                + sum(interner.nbytes() for interner in interned))
+
+    def _slice(self, table: _Table, customer_id: str) -> range:
+        code = self.customers.codes.get(customer_id)
+        if code is None:
+            return range(0)
+        return range(table.offsets[code], table.offsets[code + 1])
+
+    def customer(self, customer_id: str) -> dict:
+        """Published recommendations and RFM profiles of one customer."""
+        s = self.strings
+        rec = self.recommendations.columns
+        prof = self.profiles.columns
+        return {
+            "customer_id": customer_id,
+            "recommendations": [
+                {
+                    "id": rec["id"][i],
+                    "customer_id": customer_id,
+                    "product_id": s["product"].values[rec["product"][i]],
+                    "recommended_contact_window": s["window"].values[rec["window"][i]],
+                    "confidence_level": s["confidence"].values[rec["confidence"][i]],
+                    "reasoning": s["reasoning"].values[rec["reasoning"][i]],
+                    "generated_date": _date(rec["generated_date"][i]),
+                    "generation": self.generations["recommendation"],
+                }
+                for i in self._slice(self.recommendations, customer_id)
+            ],
+            "rfm_profiles": [
+                {
+                    "product_id": s["product"].values[prof["product"][i]],
+                    "recency_days": prof["recency_days"][i],
+                    "frequency": prof["frequency"][i],
+                    "monetary": prof["monetary"][i],
+                    "rfm_score": s["score"].values[prof["score"][i]],
+                    "segment": s["segment"].values[prof["segment"][i]],
+                    "last_purchase_date": _date(prof["last_purchase_date"][i]),
+                    "expected_repurchase_date": _date(prof["expected_repurchase_date"][i]),
+                }
+                for i in self._slice(self.profiles, customer_id)
+            ],
+        }
+
+    def stats(self) -> dict:
+        nbytes = self.nbytes()
+        return {
+            "version": self.version,
+            "generations": self.generations,
+            "customers": len(self.customers.values),
+            "recommendations": len(self.recommendations),
+            "rfm_profiles": len(self.profiles),
+            "bytes": nbytes,
+            "bytes_per_row": round(nbytes / self.rows, 1) if self.rows else 0.0,
+            "load_seconds": round(self.load_seconds, 3),
+            "loaded_at": self.loaded_at,
+        }
+
+def load_store(version: int) -> ServingStore:
+    """Read the published generations into a new store."""
+    start = time.perf_counter()
+    with Session(engine) as session:
+        generations = {
+            "recommendation": active_generation(session, "recommendation"),
+            "rfmprofile": active_generation(session, "rfmprofile"),
+        }
+        store = ServingStore(version, generations)
+        conn = session.connection().execution_options(stream_results=True, yield_per=10000)
+        customer = store.customers.code
+        for (customer_id,) in conn.execute(text(CUSTOMERS_QUERY), {
+            "recommendations": generations["recommendation"], "profiles": generations["rfmprofile"],
+        }):
+            customer(customer_id)
+
+        s = {name: interner.code for name, interner in store.strings.items()}
+        rec = store.recommendations.columns
+        for row in conn.execute(text(RECOMMENDATIONS_QUERY), {"generation": generations["recommendation"]}):
+            rec["id"].append(row.id)
+            rec["customer"].append(customer(row.customer_id))
+            rec["product"].append(s["product"](row.product_id))
+            rec["window"].append(s["window"](row.recommended_contact_window))
+            rec["confidence"].append(s["confidence"](row.confidence_level))
+            rec["reasoning"].append(s["reasoning"](row.reasoning))
+            rec["generated_date"].append(_ordinal(row.generated_date))
+
+        prof = store.profiles.columns
+        for row in conn.execute(text(PROFILES_QUERY), {"generation": generations["rfmprofile"]}):
+            prof["customer"].append(customer(row.customer_id))
+            prof["product"].append(s["product"](row.product_id))
+            prof["recency_days"].append(row.recency_days)
+            prof["frequency"].append(row.frequency)
+            prof["monetary"].append(row.monetary)
+            prof["score"].append(s["score"](row.rfm_score))
+            prof["segment"].append(s["segment"](row.segment))
+            prof["last_purchase_date"].append(_ordinal(row.last_purchase_date))
+            prof["expected_repurchase_date"].append(_ordinal(row.expected_repurchase_date))
+
+    n_customers = len(store.customers.values)
+    store.recommendations.index(rec["customer"], n_customers)
+    store.profiles.index(prof["customer"], n_customers)
+    store.load_seconds = time.perf_counter() - start
+    return store
+
+_store: Optional[ServingStore] = None
+_reload_lock = threading.Lock()
+_reloading = threading.Event()
+_trigger_lock = threading.Lock()
+
+def load_serving_store() -> ServingStore:
+    """Build a store for the current dataset version and publish it."""
+    global _store
+    with _reload_lock:
+        store = load_store(dataset_version())
+        _store = store
+    print(f"Serving store loaded: {store.stats()}")
+    return store
+
+def reload_in_background() -> None:
+    """Build a new store on a background thread (no-op if one is already loading)."""
+    with _trigger_lock:
+        if _reloading.is_set():
+            return
+        _reloading.set()
+
+    def run():
+        try:
+            load_serving_store()
+        except Exception as e:
+            print(f"Serving store reload failed: {e}")
+        finally:
+            _reloading.clear()
+
+    threading.Thread(target=run, name="serving-store-reload", daemon=True).start()
+
+def current_store() -> Optional[ServingStore]:
+    """
+    The store if it matches the current dataset version, else None (callers
+    read the DB) after scheduling a background reload.
+    """
+    store = _store
+    if store is None:
+        if settings.SERVING_STORE:
+            reload_in_background()
+        return None
+    if store.version != dataset_version():
+        reload_in_background()
+        return None
+    return store
+
+def serving_stats() -> Optional[dict]:
+    store = _store
+    return store.stats() if store else None
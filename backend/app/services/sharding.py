@@ -0,0 +1,125 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from itertools import repeat
+from typing import List, Optional, Tuple
+import pandas as pd
+from sqlmodel import Session, select
+from app.core.config import settings
+from app.core.db import engine
+from app.models.customer import Customer
+from app.services.generations import begin_generation
+from app.services.recommendation import (
+    ENGINES, attach_reasoning, load_products, write_recommendations
+)
+from app.services.rfm import (
+    ORDER_LINES_QUERY, aggregate_snapshot, compute_rfm, max_order_item_id, new_sketches, publish_profiles,
+    score_cuts, score_profiles, update_sketches, write_profiles
+)
+from app.services.snapshot import customer_range_mask, open_snapshot, sync_snapshot
+
+# Customer id range [lo, hi); None means unbounded on that side.
+Shard = Tuple[Optional[str], Optional[str]]
+
+def _code_point(column: str) -> str:
+    """`column` compared by code point, the order Python, pandas and the snapshot sort ids in."""
+    # SQLite's default BINARY collation already is; PostgreSQL's may be locale-aware.
+    return f'{column} COLLATE "C"' if engine.dialect.name == "postgresql" else column
+
+def shard_bounds(n_shards: int) -> List[Shard]:
+    """
+    Split customers into `n_shards` contiguous id ranges of equal customer
+    count. Ranges (rather than hashes) let each worker read its slice through
+    an index on order.customer_id (the "C" collation one on PostgreSQL).
+    Ids are ordered by code point, as in the snapshot masks and the serial
+    groupby, so every customer lands in exactly one shard whatever the
+    database collation.
+    """
+    with Session(engine) as session:
+        ids = sorted(session.exec(select(Customer.customer_id)).all())
+    n_shards = max(1, min(n_shards, len(ids)))
+    cuts = [ids[len(ids) * k // n_shards] for k in range(1, n_shards)]
+    return list(zip([None] + cuts, cuts + [None]))
+
+def _shard_query(shard: Shard) -> Tuple[str, dict]:
+    lo, hi = shard
+    conditions, params = [], {}
+    if lo is not None:
+        conditions.append(f"{_code_point('o.customer_id')} >= :lo")
+        params["lo"] = lo
+    if hi is not None:
+        conditions.append(f"{_code_point('o.customer_id')} < :hi")
+        params["hi"] = hi
+    query = ORDER_LINES_QUERY
+    if conditions:
+        query += "WHERE " + " AND ".join(conditions)
+    return query, params
+
+def run_shard(shard: Shard, today: date, method: str, high: int):
+    """Load -> aggregate -> sketch -> recommend for one customer range. Runs in a worker process."""
+    if settings.ANALYTICS_SOURCE == "snapshot":
+        # Every worker maps the same files; the OS shares the pages.
+        facts = open_snapshot()
+        rfm = aggregate_snapshot(facts, today, high, rows=customer_range_mask(facts, *shard))
+    else:
+        query, params = _shard_query(shard)
+        rfm = compute_rfm(query, params, today)
+    if rfm is None:
+        return None, None, None
+    with Session(engine) as session:
+        products = load_products(session)
+    profiles = rfm[["customer_id", "product_id", "recency_days", "frequency"]]
+    return rfm, ENGINES[method](profiles, products, today), update_sketches(new_sketches(), rfm)
+
+def run_sharded_analysis(workers: int, shards: Optional[int] = None) -> None:
+    """
+    Full rebuild of RFM profiles and recommendations across `workers` processes.
+
+    Every shard is independent (all metrics are per customer), so the merged
+    output is the same rows, in the same order, as the serial full rebuild;
+    explanations and the writes happen once in the parent. Scores use the
+    merge of the shards' quantile sketches, i.e. the global quintiles.
+    Shards aggregate with pandas, so RFM_ENGINE=sql is rejected rather than
+    silently ignored.
+    """
+    if settings.RFM_ENGINE == "sql":
+        raise ValueError("Sharded analysis aggregates with pandas; it does not support RFM_ENGINE=sql")
+    print(f"Starting sharded analysis ({workers} workers)...")
+    start = time.perf_counter()
+    today = date.today()
+    method = settings.RECOMMENDATION_ENGINE
+    with Session(engine) as session:
+        high = max_order_item_id(session)
+    bounds = shard_bounds(shards or settings.PIPELINE_SHARDS or workers)
+    if settings.ANALYTICS_SOURCE == "snapshot":
+        sync_snapshot()
+
+    # spawn: the API process runs job threads, which must not be forked.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        results = list(pool.map(run_shard, bounds, repeat(today), repeat(method), repeat(high)))
+    print(f"    {len(bounds)} shards computed in {time.perf_counter() - start:.2f}s")
+
+    # Shards are in customer id order, matching the serial groupby order.
+    rfm_parts = [rfm for rfm, _, _ in results if rfm is not None]
+    if not rfm_parts:
+        print("No data to analyze.")
+        return
+    rfm = pd.concat(rfm_parts, ignore_index=True)
+    recs = pd.concat([recs for _, recs, _ in results if recs is not None], ignore_index=True)
+    sketches = new_sketches()
+    for _, _, part in results:
+        for name, sketch in (part or {}).items():
+            sketches[name].merge(sketch)
+    rfm["rfm_score"] = score_profiles(rfm, score_cuts(sketches))
+
+    staging = begin_generation("rfmprofile")
+    print(f"    {write_profiles(rfm, staging)}")
+    publish_profiles(staging, high, today, sketches)
+
+    with Session(engine) as session:
+        products = load_products(session)
+    attach_reasoning(recs, products)
+    print(f"    {write_recommendations(recs, today)}")
+    print(f"Sharded analysis complete. {len(rfm)} profiles, {len(recs)} recommendations.")
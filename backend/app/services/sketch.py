@@ -0,0 +1,114 @@
+import json
+import math
+from typing import Dict, List, Optional
+import numpy as np
+
+# Mergeable quantile sketch: values are counted in fixed buckets, so two
+# sketches merge (shards, runs) and values are removed (a profile that
+# changed) by adding or subtracting bucket counts, and the result does not
+# depend on the order values arrived in.
+#
+# With relative_accuracy > 0 buckets grow geometrically (DDSketch): bucket k
+# holds (gamma^(k-1), gamma^k] and reports the value within
+# relative_accuracy of every value in it, so any quantile is within
+# relative_accuracy of the exact one. Values <= 0 share one bucket reported
+# as 0. With relative_accuracy = 0 every integer is its own bucket and
+# quantiles are exact; meant for small-range integers (counts, day numbers).
+
+class QuantileSketch:
+    def __init__(self, relative_accuracy: float = 0.01):
+        if not 0 <= relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be in [0, 1)")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.counts: Dict[int, int] = {}
+        self.zero = 0  # values <= 0 (log buckets only)
+
+    @property
+    def count(self) -> int:
+        return self.zero + sum(self.counts.values())
+
+    def _keys(self, values: np.ndarray) -> np.ndarray:
+        if not self.relative_accuracy:
+            return values.astype(np.int64)
+        return np.ceil(np.log(values) / self._log_gamma).astype(np.int64)
+
+    def _value(self, key: int) -> float:
+        if not self.relative_accuracy:
+            return float(key)
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, values, weight: int = 1) -> None:
+        """Count `values` (array-like) `weight` times; weight -1 removes them."""
+        values = np.asarray(values, dtype=np.float64 if self.relative_accuracy else np.int64)
+        if self.relative_accuracy:
+            positive = values > 0
+            self.zero += weight * int((~positive).sum())
+            values = values[positive]
+        keys, counts = np.unique(self._keys(values), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            total = self.counts.get(key, 0) + weight * count
+            if total:
+                self.counts[key] = total
+            else:
+                del self.counts[key]
+
+    def remove(self, values) -> None:
+        self.add(values, weight=-1)
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different accuracies")
+        self.zero += other.zero
+        for key, count in other.counts.items():
+            total = self.counts.get(key, 0) + count
+            if total:
+                self.counts[key] = total
+            else:
+                self.counts.pop(key, None)
+        return self
+
+    def quantiles(self, n_tiles: int) -> Optional[List[float]]:
+        """
+        The n_tiles - 1 cut points between equal-count tiles (4 for quintiles):
+        cut k is the smallest value with at least k/n_tiles of the values at or
+        below it. None if the sketch is empty.
+        """
+        n = self.count
+        if n <= 0:
+            return None
+        # Integer ranks: k * n / n_tiles rounded up, without float error.
+        targets = [-(-k * n // n_tiles) for k in range(1, n_tiles)]
+        cuts = []
+        seen = self.zero
+        buckets = iter(sorted(self.counts.items()))
+        key = None
+        for target in targets:
+            while seen < target:
+                key, count = next(buckets)
+                seen += count
+            cuts.append(0.0 if key is None else self._value(key))
+        return cuts
+
+    def to_dict(self) -> dict:
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "zero": self.zero,
+            "counts": [[key, count] for key, count in sorted(self.counts.items())],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QuantileSketch":
+        sketch = cls(data["relative_accuracy"])
+        sketch.zero = data["zero"]
+        sketch.counts = {key: count for key, count in data["counts"]}
+        return sketch
+
+def dump_sketches(sketches: Dict[str, QuantileSketch]) -> str:
+    return json.dumps({name: sketch.to_dict() for name, sketch in sketches.items()})
+
+def load_sketches(value: Optional[str]) -> Optional[Dict[str, QuantileSketch]]:
+    if not value:
+        return None
+    return {name: QuantileSketch.from_dict(data) for name, data in json.loads(value).items()}
@@ -0,0 +1,196 @@
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlmodel import Session
+from app.core.config import settings
+from app.core.db import engine
+from app.services.state import get_state
+
+# Columnar snapshot of order facts, one row per order line, kept next to the
+# DB as fixed-width column files that readers memory-map (no copy, no parse).
+# Ids are integer-encoded through append-only dictionaries and dates are day
+# numbers. Prices are looked up from the product table at read time, so a
+# price change needs no rewrite and results match the SQL join.
+#
+# Order lines are append-only, so the snapshot only ever appends lines past
+# its `high` item id. A history reset bumps ORDERS_EPOCH_KEY, which makes the
+# next sync start over.
+ORDERS_EPOCH_KEY = "orders.epoch"
+
+COLUMNS = {
+    "item_id": np.int64,
+    "customer": np.int32,
+    "product": np.int32,
+    "day": np.int32,  # days since 1970-01-01
+    "quantity": np.int32,
+}
+DICTIONARIES = {"customer": "customers.txt", "product": "products.txt"}
+
+NEW_LINES_QUERY = """
+SELECT oi.id AS item_id, o.customer_id, oi.product_id, o.order_date, oi.quantity
+FROM orderitem oi
+JOIN "order" o ON oi.order_id = o.order_id
+WHERE oi.id > :high
+ORDER BY oi.id
+"""
+
+_sync_lock = threading.Lock()
+
+def bump_epoch(conn: Connection) -> None:
+    """Invalidate snapshots; call in the transaction that deletes order history."""
+    updated = conn.execute(
+        text("UPDATE pipelinestate SET value = CAST(CAST(value AS INTEGER) + 1 AS VARCHAR) WHERE key = :key"),
+        {"key": ORDERS_EPOCH_KEY}
+    ).rowcount
+    if not updated:
+        conn.execute(text("INSERT INTO pipelinestate (key, value) VALUES (:key, '1')"), {"key": ORDERS_EPOCH_KEY})
+
+@dataclass
+class OrderFacts:
+    """Memory-mapped order lines plus the id dictionaries their codes index into."""
+    item_id: np.ndarray
+    customer: np.ndarray
+    product: np.ndarray
+    day: np.ndarray
+    quantity: np.ndarray
+    customer_ids: np.ndarray  # code -> customer_id
+    product_ids: np.ndarray  # code -> product_id
+    high: int
+
+    def __len__(self) -> int:
+        return len(self.item_id)
+
+    def rows_after(self, item_id: int) -> int:
+        """Position of the first line with an id greater than `item_id`."""
+        return int(np.searchsorted(self.item_id, item_id, side="right"))
+
+def _path(name: str) -> str:
+    return os.path.join(settings.SNAPSHOT_DIR, name)
+
+def _read_meta() -> Optional[dict]:
+    try:
+        with open(_path("meta.json")) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _write_meta(meta: dict) -> None:
+    # Readers size their maps from the meta file, so replacing it atomically
+    # is what publishes appended rows.
+    tmp = _path("meta.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, _path("meta.json"))
+
+def _read_dictionary(name: str, count: int) -> List[str]:
+    if not count:
+        return []
+    with open(_path(DICTIONARIES[name])) as f:
+        return [next(f).rstrip("\n") for _ in range(count)]
+
+def _map(name: str, rows: int) -> np.ndarray:
+    dtype = COLUMNS[name]
+    if rows == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(_path(f"{name}.bin"), dtype=dtype, mode="r", shape=(rows,))
+
+def open_snapshot() -> Optional[OrderFacts]:
+    """Map the published snapshot read-only, or None if there is none yet."""
+    meta = _read_meta()
+    if meta is None:
+        return None
+    return OrderFacts(
+        **{name: _map(name, meta["rows"]) for name in COLUMNS},
+        customer_ids=np.array(_read_dictionary("customer", meta["customers"]), dtype=object),
+        product_ids=np.array(_read_dictionary("product", meta["products"]), dtype=object),
+        high=meta["high"],
+    )
+
+def _truncate(meta: dict) -> None:
+    """Drop bytes past the published counts (left by an interrupted sync)."""
+    for name, dtype in COLUMNS.items():
+        with open(_path(f"{name}.bin"), "ab") as f:
+            f.truncate(meta["rows"] * np.dtype(dtype).itemsize)
+    for name, filename in DICTIONARIES.items():
+        with open(_path(filename), "ab+") as f:
+            f.seek(0)
+            size = sum(len(f.readline()) for _ in range(meta[f"{name}s"]))
+            f.truncate(size)
+
+def _encode(values: pd.Series, lookup: Dict[str, int], appended: List[str]) -> np.ndarray:
+    for value in values.unique():
+        if value not in lookup:
+            lookup[value] = len(lookup)
+            appended.append(value)
+    return values.map(lookup).to_numpy(dtype=np.int32)
+
+def sync_snapshot() -> OrderFacts:
+    """Append order lines added since the last sync (or rebuild after a reset) and map the result."""
+    with _sync_lock:
+        os.makedirs(settings.SNAPSHOT_DIR, exist_ok=True)
+        with Session(engine) as session:
+            epoch = get_state(session, ORDERS_EPOCH_KEY, "0")
+            db_high = session.execute(text("SELECT MAX(id) FROM orderitem")).scalar() or 0
+        meta = _read_meta()
+        # A max id below ours means lines were deleted behind our back.
+        if meta is None or meta["epoch"] != epoch or meta["high"] > db_high:
+            meta = {"epoch": epoch, "high": 0, "rows": 0, "customers": 0, "products": 0}
+        _truncate(meta)
+
+        lookups = {
+            name: {value: code for code, value in enumerate(_read_dictionary(name, meta[f"{name}s"]))}
+            for name in DICTIONARIES
+        }
+        files = {name: open(_path(f"{name}.bin"), "ab") for name in COLUMNS}
+        dictionary_files = {name: open(_path(filename), "a") for name, filename in DICTIONARIES.items()}
+        try:
+            with engine.connect().execution_options(stream_results=True) as conn:
+                for chunk in pd.read_sql(text(NEW_LINES_QUERY), conn, params={"high": meta["high"]},
+                                         chunksize=max(settings.RFM_CHUNK_SIZE, settings.BULK_BATCH_SIZE)):
+                    if chunk.empty:
+                        continue
+                    columns = {
+                        "item_id": chunk["item_id"].to_numpy(dtype=np.int64),
+                        "day": pd.to_datetime(chunk["order_date"]).to_numpy()
+                                 .astype("datetime64[D]").astype(np.int32),
+                        "quantity": chunk["quantity"].to_numpy(dtype=np.int32),
+                    }
+                    for name, source in (("customer", "customer_id"), ("product", "product_id")):
+                        appended: List[str] = []
+                        columns[name] = _encode(chunk[source], lookups[name], appended)
+                        dictionary_files[name].writelines(value + "\n" for value in appended)
+                    for name, dtype in COLUMNS.items():
+                        files[name].write(columns[name].astype(dtype, copy=False).tobytes())
+                    meta["rows"] += len(chunk)
+                    meta["high"] = int(columns["item_id"][-1])
+        finally:
+            for f in [*files.values(), *dictionary_files.values()]:
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+        meta["customers"] = len(lookups["customer"])
+        meta["products"] = len(lookups["product"])
+        _write_meta(meta)
+    return open_snapshot()
+
+def product_prices(product_ids: np.ndarray) -> np.ndarray:
+    """Current price per product code; NaN for products no longer in the catalogue."""
+    prices = pd.read_sql("SELECT product_id, price FROM product", engine).set_index("product_id")["price"]
+    return prices.reindex(product_ids).to_numpy(dtype=np.float64)
+
+def customer_range_mask(facts: OrderFacts, lo: Optional[str], hi: Optional[str]) -> np.ndarray:
+    """Row mask of the lines whose customer_id lies in [lo, hi)."""
+    keep = np.ones(len(facts.customer_ids), dtype=bool)
+    if lo is not None:
+        keep &= facts.customer_ids >= lo
+    if hi is not None:
+        keep &= facts.customer_ids < hi
+    return keep[facts.customer]
@@ -0,0 +1,17 @@
+from typing import Optional
+from sqlmodel import Session
+from app.models.analysis import PipelineState
+
+def get_state(session: Session, key: str, default: Optional[str] = None) -> Optional[str]:
+    """Read a persisted pipeline value, or `default` if it was never set."""
+    state = session.get(PipelineState, key)
+    return state.value if state else default
+
+def set_state(session: Session, key: str, value) -> None:
+    """Persist a pipeline value. The caller is responsible for committing."""
+    state = session.get(PipelineState, key)
+    if state:
+        state.value = str(value)
+    else:
+        state = PipelineState(key=key, value=str(value))
+    session.add(state)
@@ -0,0 +1,47 @@
+"""
+Explanation throughput benchmark against the offline fake LLM backend.
+
+Run from backend/:
+    python benchmarks/explanation_bench.py --prompts 2000 --latency-ms 200 --concurrency 32 --rate 0
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure explanation throughput offline.")
+    parser.add_argument("--prompts", type=int, default=1000, help="Distinct prompts to resolve")
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=0.0, help="Request starts per second (0 = unlimited)")
+    args = parser.parse_args()
+
+    # Settings are read at call time, so override them before the first run.
+    from app.core.config import settings
+    settings.EXPLANATION_CONCURRENCY = args.concurrency
+    settings.EXPLANATION_RATE_LIMIT = args.rate
+
+    from app.services.explanation import ExplanationPrompt, FakeLLMBackend, explain_many
+
+    backend = FakeLLMBackend(args.latency_ms)
+    prompts = [
+        ExplanationPrompt(f"Product {i % 500}", "Follow-up (Late)", "medium", -(i // 500))
+        for i in range(args.prompts)
+    ]
+
+    start = time.perf_counter()
+    explain_many(prompts, backend=backend)
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    explain_many(prompts, backend=backend)
+    warm = time.perf_counter() - start
+
+    print(f"cold: {args.prompts} prompts in {cold:.2f}s ({args.prompts / cold:,.0f} prompts/sec)")
+    print(f"warm (memoized): {warm * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
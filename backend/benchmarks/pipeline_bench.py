@@ -0,0 +1,293 @@
+"""
+End-to-end pipeline benchmark.
+
+Builds a seeded synthetic dataset per scale in a throwaway SQLite DB, times
+every pipeline stage separately, records peak traced memory per stage and
+writes the results as JSON. With --baseline, exits non-zero if any stage is
+slower than the baseline by more than the allowed threshold.
+
+Run from backend/:
+    python benchmarks/pipeline_bench.py --scales small medium --output bench_results.json
+    python benchmarks/pipeline_bench.py --scales small --save-baseline benchmarks/baseline.json
+    python benchmarks/pipeline_bench.py --scales small --baseline benchmarks/baseline.json --threshold 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# Generator parameters per scale; 1-3 items per order gives ~2 line items per order.
+SCALES = {
+    "small": dict(n_customers=500, n_products=20, n_orders=5_000),              # ~10k line items
+    "medium": dict(n_customers=50_000, n_products=200, n_orders=500_000),       # ~1M line items
+    "large": dict(n_customers=500_000, n_products=500, n_orders=5_000_000),     # ~10M line items
+}
+
+STAGES = [
+    "data_load", "rfm_aggregate", "snapshot_sync", "snapshot_aggregate", "rfm_score", "rfm_persist", "rfm_pushdown",
+    "recommendation_compute", "recommendation_persist", "serve_recommendations", "serve_customer_360",
+    "sharded_analysis",
+]
+
+class StageRecorder:
+    def __init__(self, trace_memory: bool):
+        self.trace_memory = trace_memory
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = {}
+        try:
+            yield result
+        finally:
+            elapsed = time.perf_counter() - start
+            result["seconds"] = round(elapsed, 4)
+            if self.trace_memory:
+                result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+                tracemalloc.stop()
+            self.stages[name] = result
+            print(f"    {name:<24} {elapsed:9.3f}s" + (f"  peak {result['peak_mb']:.1f} MB" if self.trace_memory else ""))
+
+def run_scale(name: str, args) -> dict:
+    import pandas as pd
+    from fastapi.testclient import TestClient
+    from sqlmodel import Session, select
+    from app.core.config import settings
+    from app.core.db import engine
+    from app.main import app
+    from app.models.customer import Customer
+    from app.services.cache import response_cache
+    from app.services.generations import begin_generation, collect_garbage, publish_generation
+    from app.services.mock_data import generate_dataset
+    from app.services.sharding import run_sharded_analysis
+    from app.services.rfm import (
+        ORDER_LINES_QUERY, aggregate_snapshot, compute_rfm, new_sketches, pushdown_rfm, score_cuts,
+        score_profiles, score_staged, sketch_profiles, update_sketches, write_profiles
+    )
+    from app.services.snapshot import sync_snapshot
+    from app.services.recommendation import (
+        ENGINES, load_inputs, attach_reasoning, write_recommendations
+    )
+
+    print(f"[{name}] {SCALES[name]}")
+    recorder = StageRecorder(trace_memory=not args.no_memory)
+    today = date.today()
+    rows = {}
+
+    with recorder.stage("data_load"):
+        # end_date=today keeps the recency/window mix stable from day to day.
+        dataset = generate_dataset(reset=True, seed=args.seed, end_date=today, **SCALES[name])
+        rows["line_items"] = dataset["line_items"]
+
+    with recorder.stage("rfm_aggregate"):
+        rfm = compute_rfm(ORDER_LINES_QUERY, {}, today)
+        rfm = rfm if rfm is not None else pd.DataFrame()
+        rows["profiles"] = len(rfm)
+
+    # Columnar fast path over the same lines; must produce the same profiles.
+    with recorder.stage("snapshot_sync"):
+        facts = sync_snapshot()
+    with recorder.stage("snapshot_aggregate"):
+        snapshot_rfm = aggregate_snapshot(facts, today, facts.high)
+    if len(rfm):
+        pd.testing.assert_frame_equal(rfm, snapshot_rfm)
+    del facts, snapshot_rfm
+
+    with recorder.stage("rfm_score"):
+        sketches = update_sketches(new_sketches(), rfm)
+        rfm["rfm_score"] = score_profiles(rfm, score_cuts(sketches))
+
+    with recorder.stage("rfm_persist"):
+        staging = begin_generation("rfmprofile")
+        write_profiles(rfm, staging)
+        with Session(engine) as session:
+            publish_generation(session, "rfmprofile", staging)
+            session.commit()
+        collect_garbage("rfmprofile")
+    del rfm
+
+    # SQL engine: aggregate + write in the DB. Left unpublished; must match.
+    with recorder.stage("rfm_pushdown"):
+        pushdown_generation = begin_generation("rfmprofile")
+        pushdown_rfm(pushdown_generation, today)
+        pushdown_sketches = new_sketches()
+        sketch_profiles(pushdown_sketches, pushdown_generation)
+        score_staged(pushdown_generation, score_cuts(pushdown_sketches))
+    pd.testing.assert_frame_equal(_published_profiles(), _published_profiles(pushdown_generation))
+
+    with recorder.stage("recommendation_compute"):
+        with Session(engine) as session:
+            profiles, products = load_inputs(session)
+        recs = ENGINES[settings.RECOMMENDATION_ENGINE](profiles, products, today)
+        attach_reasoning(recs, products)
+        rows["recommendations"] = len(recs)
+
+    with recorder.stage("recommendation_persist"):
+        write_recommendations(recs, today)
+    del recs, profiles
+
+    with recorder.stage("serve_recommendations") as result:
+        # Cold: the response cache is emptied first, so the query runs. Warm:
+        # the same request again, answered from the cache.
+        latencies = {"cold": [], "warm": []}
+        with TestClient(app) as client:
+            for _ in range(args.requests):
+                for kind in ("cold", "warm"):
+                    if kind == "cold":
+                        response_cache.clear()
+                    start = time.perf_counter()
+                    response = client.get("/api/recommendations")
+                    latencies[kind].append(time.perf_counter() - start)
+                    response.raise_for_status()
+        for kind, values in latencies.items():
+            result[f"{kind}_p50_ms"] = round(statistics.median(values) * 1000, 2)
+            result[f"{kind}_max_ms"] = round(max(values) * 1000, 2)
+
+    with Session(engine) as session:
+        customer_ids = session.exec(select(Customer.customer_id).limit(500)).all()
+    with recorder.stage("serve_customer_360") as result:
+        # Fixed query count per call: latency should barely grow with the batch.
+        with TestClient(app) as client:
+            for size in (1, 50, 500):
+                start = time.perf_counter()
+                client.post("/api/customers/360", json={"customer_ids": customer_ids[:size]}).raise_for_status()
+                result[f"batch_{size}_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+    if args.workers > 1:
+        serial_profiles = _published_profiles()
+        with recorder.stage("sharded_analysis"):
+            run_sharded_analysis(args.workers)
+        # Sharded output must be the same rows as the serial rebuild.
+        pd.testing.assert_frame_equal(serial_profiles, _published_profiles())
+
+    return {"rows": rows, "stages": recorder.stages}
+
+def _published_profiles(generation=None):
+    import pandas as pd
+    from sqlalchemy import text
+    from sqlmodel import Session
+    from app.core.db import engine
+    from app.services.generations import active_generation
+    with Session(engine) as session:
+        return pd.read_sql(
+            text("SELECT customer_id, product_id, recency_days, frequency, monetary, rfm_score, segment, "
+                 "last_purchase_date, expected_repurchase_date "
+                 "FROM rfmprofile WHERE generation = :g ORDER BY id"),
+            session.connection(),
+            params={"g": active_generation(session, "rfmprofile") if generation is None else generation}
+        )
+
+def compare(results: dict, baseline: dict, threshold: float, overrides: dict, min_seconds: float) -> list:
+    """Return a list of human-readable regressions (empty if all stages are within budget)."""
+    regressions = []
+    for scale, current in results["scales"].items():
+        base_scale = baseline.get("scales", {}).get(scale)
+        if not base_scale:
+            print(f"[{scale}] no baseline, skipping comparison")
+            continue
+        for stage, timing in current["stages"].items():
+            base = base_scale["stages"].get(stage)
+            # Stages below the noise floor are too short to compare reliably.
+            if not base or base["seconds"] < min_seconds:
+                continue
+            ratio = timing["seconds"] / base["seconds"]
+            allowed = 1 + overrides.get(stage, threshold)
+            status = "REGRESSION" if ratio > allowed else "ok"
+            print(f"[{scale}] {stage:<24} {base['seconds']:9.3f}s -> {timing['seconds']:9.3f}s  x{ratio:.2f}  {status}")
+            if ratio > allowed:
+                regressions.append(f"{scale}/{stage}: x{ratio:.2f} (allowed x{allowed:.2f})")
+    return regressions
+
+def parse_overrides(values) -> dict:
+    overrides = {}
+    for value in values or []:
+        stage, _, limit = value.partition("=")
+        if stage not in STAGES or not limit:
+            raise SystemExit(f"Invalid --stage-threshold {value!r}; expected STAGE=FRACTION with STAGE in {STAGES}")
+        overrides[stage] = float(limit)
+    return overrides
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analytics pipeline stage by stage.")
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=["small"])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=5, help="Cold and warm GET /recommendations calls to time")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="Baseline JSON to compare against")
+    parser.add_argument("--save-baseline", help="Also write the results to this baseline path")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed slowdown vs baseline as a fraction (0.25 = 25%%)")
+    parser.add_argument("--stage-threshold", action="append", metavar="STAGE=FRACTION",
+                        help="Per-stage override of --threshold (repeatable)")
+    parser.add_argument("--min-seconds", type=float, default=0.05,
+                        help="Ignore stages whose baseline is faster than this")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="Skip tracemalloc (it adds overhead to the timings)")
+    parser.add_argument("--db", help="SQLite file to use instead of a temporary one")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Also time a sharded full rebuild with this many processes")
+    args = parser.parse_args()
+    overrides = parse_overrides(args.stage_threshold)
+
+    # The app binds its engine at import time, so point it at the benchmark DB first.
+    tmp_dir = None
+    db_path = args.db
+    if not db_path:
+        tmp_dir = tempfile.mkdtemp(prefix="pipeline-bench-")
+        db_path = os.path.join(tmp_dir, "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["SNAPSHOT_DIR"] = os.path.join(tmp_dir or os.path.dirname(os.path.abspath(db_path)), "snapshot")
+
+    import app.main  # noqa: F401  (registers every table model before create_all)
+    from app.core.db import create_db_and_tables, engine
+    create_db_and_tables()
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "traced_memory": not args.no_memory,
+        },
+        "scales": {},
+    }
+    try:
+        for scale in args.scales:
+            results["scales"][scale] = run_scale(scale, args)
+    finally:
+        engine.dispose()
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, overrides, args.min_seconds)
+        if regressions:
+            print("Performance regressions detected:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+API startup benchmark.
+
+Seeds a throwaway SQLite DB (mock data + one pipeline run), then starts
+uvicorn in a fresh process several times and measures the time from spawn
+to the first successful GET /api/recommendations. Also records the import
+time of app.main and fails if importing it loads the analytics stack
+(pandas/numpy), which must stay deferred until the first pipeline call.
+With --baseline, exits non-zero if the median time to first request is
+slower than the baseline by more than the allowed threshold.
+
+Run from backend/:
+    python benchmarks/startup_bench.py --output startup_results.json
+    python benchmarks/startup_bench.py --save-baseline benchmarks/startup_baseline.json
+    python benchmarks/startup_bench.py --baseline benchmarks/startup_baseline.json --threshold 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from datetime import date, datetime
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, BACKEND)
+
+HEAVY_MODULES = ["pandas", "numpy"]
+
+IMPORT_PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import app.main
+print(json.dumps({{
+    "seconds": time.perf_counter() - start,
+    "heavy_modules": [m for m in {HEAVY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+def seed(args) -> None:
+    from app.core.db import create_db_and_tables, engine
+    from app.services.mock_data import generate_dataset
+    from app.services.pipeline import run_pipeline
+    create_db_and_tables()
+    generate_dataset(reset=True, seed=args.seed, end_date=date.today(),
+                     n_customers=args.customers, n_products=20, n_orders=args.customers * 10)
+    run_pipeline(full_rebuild=True)
+    engine.dispose()
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _get(url: str) -> bool:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status == 200
+    except (urllib.error.URLError, ConnectionError, OSError):
+        return False
+
+def time_to_first_request(env: dict, path: str, timeout: float) -> dict:
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}{path}"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while not _get(url):
+            if process.poll() is not None:
+                raise SystemExit(f"uvicorn exited with {process.returncode} before serving {path}")
+            if time.perf_counter() - start > timeout:
+                raise SystemExit(f"No successful response from {path} within {timeout}s")
+            time.sleep(0.01)
+        first = time.perf_counter() - start
+        # A second request shows what the first one paid for lazily.
+        second_start = time.perf_counter()
+        _get(url)
+        return {"first_request_s": round(first, 4), "second_request_ms": round((time.perf_counter() - second_start) * 1000, 2)}
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+def measure_import(env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE], cwd=BACKEND, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    probe = json.loads(output.strip().splitlines()[-1])
+    return {"seconds": round(probe["seconds"], 4), "heavy_modules": probe["heavy_modules"]}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark API startup (time to first successful request).")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/api/recommendations?limit=1", help="Request that must succeed")
+    parser.add_argument("--customers", type=int, default=500, help="Mock customers to seed (10 orders each)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", default="startup_results.json")
+    parser.add_argument("--baseline", help="Baseline JSON to compare against")
+    parser.add_argument("--save-baseline", help="Also write the results to this baseline path")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed slowdown vs baseline as a fraction (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="startup-bench-")
+    # The app binds its engine at import time, so point it at the benchmark DB first.
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+    os.environ["SNAPSHOT_DIR"] = os.path.join(tmp_dir, "snapshot")
+    env = dict(os.environ)
+    try:
+        seed(args)
+        imported = measure_import(env)
+        print(f"import app.main: {imported['seconds']:.3f}s, heavy modules loaded: {imported['heavy_modules'] or 'none'}")
+        runs = []
+        for run in range(args.runs):
+            result = time_to_first_request(env, args.path, args.timeout)
+            runs.append(result)
+            print(f"    run {run + 1}: first request after {result['first_request_s']:.3f}s, "
+                  f"next one {result['second_request_ms']:.1f} ms")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    first = [run["first_request_s"] for run in runs]
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "path": args.path,
+        },
+        "import": imported,
+        "startup": {
+            "first_request_median_s": round(statistics.median(first), 4),
+            "first_request_min_s": min(first),
+            "runs": runs,
+        },
+    }
+    print(f"Time to first request: median {results['startup']['first_request_median_s']:.3f}s "
+          f"over {args.runs} runs")
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {path}")
+
+    failures = []
+    if imported["heavy_modules"]:
+        failures.append(f"importing app.main loads {imported['heavy_modules']}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            base = json.load(f)["startup"]["first_request_median_s"]
+        ratio = results["startup"]["first_request_median_s"] / base
+        status = "REGRESSION" if ratio > 1 + args.threshold else "ok"
+        print(f"first request {base:.3f}s -> {results['startup']['first_request_median_s']:.3f}s  x{ratio:.2f}  {status}")
+        if ratio > 1 + args.threshold:
+            failures.append(f"time to first request x{ratio:.2f} (allowed x{1 + args.threshold:.2f})")
+    if failures:
+        print("Startup regressions detected:")
+        for line in failures:
+            print(f"  - {line}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
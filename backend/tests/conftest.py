@@ -0,0 +1,31 @@
+import os
+import shutil
+import sys
+import tempfile
+from datetime import date
+import pytest
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, BACKEND)
+
+# The app binds its engine at import time, so point it at a throwaway DB
+# before any test imports it.
+TMP_DIR = tempfile.mkdtemp(prefix="tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TMP_DIR, 'test.db')}"
+os.environ["SNAPSHOT_DIR"] = os.path.join(TMP_DIR, "snapshot")
+os.environ["PROFILE_DIR"] = os.path.join(TMP_DIR, "profiles")
+
+@pytest.fixture(scope="session")
+def dataset() -> dict:
+    """A small seeded order history in the test DB."""
+    import app.main  # registers every table
+    from app.core.db import create_db_and_tables
+    from app.services.mock_data import generate_dataset
+    create_db_and_tables()
+    return generate_dataset(reset=True, seed=7, end_date=date.today(),
+                            n_customers=200, n_products=20, n_orders=2000)
+
+def pytest_sessionfinish(session, exitstatus):
+    if "app.core.db" in sys.modules:
+        sys.modules["app.core.db"].engine.dispose()
+    shutil.rmtree(TMP_DIR, ignore_errors=True)
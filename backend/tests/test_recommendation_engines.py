@@ -0,0 +1,65 @@
+from datetime import date
+import pandas as pd
+import pytest
+from app.services.recommendation import compute_recommendations_loop, compute_recommendations_vectorized
+
+# days until expected = cycle - recency_days; covers every window boundary.
+DAYS = [-30, -8, -7, -1, 0, 1, 5, 6, 40]
+FREQUENCIES = [1, 2, 4, 5, 9]
+
+def make_inputs():
+    products = pd.DataFrame({
+        "product_id": ["P-ALL", "P-SUMMER", "P-WINTER"],
+        "product_name": ["All year", "Summer", "Winter"],
+        "consumption_cycle_days": [30, 45, 60],
+        "seasonality": ["all_year", "summer", "winter"],
+    })
+    cycles = dict(zip(products["product_id"], products["consumption_cycle_days"]))
+    rows = []
+    for product_id in [*cycles, "P-UNKNOWN"]:
+        for i, days in enumerate(DAYS):
+            rows.append({
+                "customer_id": f"C{len(rows):03d}",
+                "product_id": product_id,
+                "recency_days": cycles.get(product_id, 30) - days,
+                "frequency": FREQUENCIES[i % len(FREQUENCIES)],
+            })
+    return pd.DataFrame(rows), products
+
+@pytest.mark.parametrize("today", [date(2025, 1, 15), date(2025, 7, 15), date(2025, 4, 15)],
+                         ids=["winter", "summer", "all_year"])
+def test_engines_produce_identical_rows(today):
+    profiles, products = make_inputs()
+    loop = compute_recommendations_loop(profiles, products, today)
+    vectorized = compute_recommendations_vectorized(profiles, products, today)
+    assert loop.equals(vectorized)
+    assert not loop.empty
+
+def test_window_boundaries_and_filters():
+    profiles, products = make_inputs()
+    recs = compute_recommendations_vectorized(profiles, products, date(2025, 1, 15))
+    # Off-season (summer) and unknown products are never recommended.
+    assert set(recs["product_id"]) == {"P-ALL", "P-WINTER"}
+    windows = dict(zip(recs.loc[recs["product_id"] == "P-ALL", "days_until_expected"],
+                       recs.loc[recs["product_id"] == "P-ALL", "recommended_contact_window"]))
+    assert windows == {
+        -30: "Churn Risk / Win-back",
+        -8: "Churn Risk / Win-back",
+        -7: "Follow-up (Late)",
+        -1: "Follow-up (Late)",
+        # Early Reminder is checked first, so 0 never reaches On-time.
+        0: "Early Reminder",
+        1: "Early Reminder",
+        5: "Early Reminder",
+    }
+    confidence = recs.merge(profiles, on=["customer_id", "product_id"])[["frequency", "confidence_level"]]
+    assert {(f, c) for f, c in confidence.itertuples(index=False)} == {
+        (1, "low"), (2, "medium"), (4, "medium"), (5, "high"), (9, "high")
+    }
+
+def test_empty_profiles():
+    profiles, products = make_inputs()
+    empty = profiles.iloc[:0]
+    today = date(2025, 1, 15)
+    assert compute_recommendations_loop(empty, products, today).equals(
+        compute_recommendations_vectorized(empty, products, today))
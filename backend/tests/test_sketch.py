@@ -0,0 +1,133 @@
+import json
+import uuid
+from datetime import date
+import numpy as np
+import pytest
+from app.services.sketch import QuantileSketch, dump_sketches, load_sketches
+
+TILES = 5
+
+def exact_quantiles(values, n_tiles: int = TILES) -> list:
+    """Cut k: the smallest value with at least k/n_tiles of the values at or below it."""
+    ordered = np.sort(values)
+    n = len(ordered)
+    return [float(ordered[-(-k * n // n_tiles) - 1]) for k in range(1, n_tiles)]
+
+def relative_error(estimate: list, exact: list) -> float:
+    return max(abs(e - x) / abs(x) if x else abs(e) for e, x in zip(estimate, exact))
+
+@pytest.mark.parametrize("accuracy", [0.001, 0.01, 0.05])
+@pytest.mark.parametrize("n", [1, 7, 1000, 20000])
+def test_quantiles_within_relative_accuracy(accuracy, n):
+    values = np.random.default_rng(n).lognormal(mean=4, sigma=1.5, size=n)
+    sketch = QuantileSketch(accuracy)
+    sketch.add(values)
+    assert relative_error(sketch.quantiles(TILES), exact_quantiles(values)) <= accuracy + 1e-12
+
+def test_non_positive_values_report_zero():
+    values = np.array([-3.0, 0.0, 0.0, 0.0, 5.0, 10.0, 20.0, 40.0])
+    sketch = QuantileSketch(0.01)
+    sketch.add(values)
+    estimate, exact = sketch.quantiles(4), exact_quantiles(np.maximum(values, 0), 4)
+    assert estimate[:2] == [0.0, 0.0]
+    assert relative_error(estimate, exact) <= 0.01 + 1e-12
+
+def test_integer_buckets_are_exact():
+    values = np.random.default_rng(1).integers(-500, 500, size=5000)
+    sketch = QuantileSketch(0)
+    sketch.add(values)
+    assert sketch.quantiles(TILES) == exact_quantiles(values)
+
+@pytest.mark.parametrize("accuracy", [0, 0.01])
+def test_merge_and_remove_match_a_single_sketch(accuracy):
+    values = np.random.default_rng(2).lognormal(mean=3, sigma=1, size=3000).round()
+    whole = QuantileSketch(accuracy)
+    whole.add(values)
+    left, right = QuantileSketch(accuracy), QuantileSketch(accuracy)
+    left.add(values[:1000])
+    right.add(values[1000:])
+    assert left.merge(right).to_dict() == whole.to_dict()
+
+    whole.remove(values[1000:])
+    expected = QuantileSketch(accuracy)
+    expected.add(values[:1000])
+    assert whole.to_dict() == expected.to_dict()
+
+def test_merge_rejects_different_accuracies():
+    with pytest.raises(ValueError):
+        QuantileSketch(0.01).merge(QuantileSketch(0.02))
+
+def test_empty_sketch_has_no_quantiles():
+    sketch = QuantileSketch(0.01)
+    sketch.add([1.0, 2.0])
+    sketch.remove([1.0, 2.0])
+    assert sketch.quantiles(TILES) is None
+    assert sketch.counts == {}
+
+def test_serialisation_round_trip():
+    sketches = {"a": QuantileSketch(0), "b": QuantileSketch(0.01)}
+    sketches["a"].add([1, 2, 2, 9])
+    sketches["b"].add([0.0, 1.5, 300.0])
+    restored = load_sketches(dump_sketches(sketches))
+    assert {k: s.to_dict() for k, s in restored.items()} == {k: s.to_dict() for k, s in sketches.items()}
+    assert load_sketches(None) is None
+
+def _persisted_sketches() -> dict:
+    from sqlmodel import Session
+    from app.core.db import engine
+    from app.services.rfm import SKETCHES_KEY
+    from app.services.state import get_state
+    with Session(engine) as session:
+        return {name: s.to_dict() for name, s in load_sketches(get_state(session, SKETCHES_KEY)).items()}
+
+def _published_profiles():
+    import pandas as pd
+    from sqlalchemy import text
+    from sqlmodel import Session
+    from app.core.db import engine
+    from app.services.generations import active_generation
+    with Session(engine) as session:
+        return pd.read_sql(
+            text("SELECT last_purchase_date, frequency, monetary FROM rfmprofile WHERE generation = :g"),
+            session.connection(), params={"g": active_generation(session, "rfmprofile")}
+        )
+
+def test_persisted_sketches_describe_published_profiles(dataset):
+    from app.core.config import settings
+    from app.services.rfm import SCORE_TILES, new_sketches, run_rfm_analysis, sketch_values, update_sketches
+    run_rfm_analysis(full_rebuild=True)
+    profiles = _published_profiles()
+    sketches = update_sketches(new_sketches(), profiles)
+    assert _persisted_sketches() == {name: s.to_dict() for name, s in sketches.items()}
+    for name, values in sketch_values(profiles).items():
+        bound = settings.RFM_SKETCH_ACCURACY if sketches[name].relative_accuracy else 0.0
+        error = relative_error(sketches[name].quantiles(SCORE_TILES), exact_quantiles(values, SCORE_TILES))
+        assert error <= bound + 1e-12, name
+
+def test_incremental_sketches_match_full_rebuild(dataset):
+    from sqlalchemy import text
+    from sqlmodel import Session
+    from app.core.db import engine
+    from app.services.ingest import ingest_orders
+    from app.services.rfm import run_rfm_analysis
+    run_rfm_analysis(full_rebuild=True)
+    before = _persisted_sketches()
+    with Session(engine) as session:
+        pairs = session.execute(text(
+            'SELECT o.customer_id, oi.product_id FROM orderitem oi JOIN "order" o ON oi.order_id = o.order_id '
+            'ORDER BY oi.id LIMIT 20'
+        )).all()
+    run_id = uuid.uuid4().hex[:8]
+    upload = "\n".join(
+        json.dumps({"order_id": f"TEST-{run_id}-{i}", "customer_id": customer_id,
+                    "order_date": date.today().isoformat(),
+                    "line_items": [{"product_id": product_id, "quantity": 1 + i % 3}]})
+        for i, (customer_id, product_id) in enumerate(pairs)
+    )
+    assert ingest_orders([upload.encode()], "ndjson").inserted == len(pairs) == 20
+
+    run_rfm_analysis()
+    incremental = _persisted_sketches()
+    assert incremental != before
+    run_rfm_analysis(full_rebuild=True)
+    assert incremental == _persisted_sketches()
@@ -3,8 +3,24 @@ from sqlmodel import Session, select
 from app.models.analysis import Recommendation    
 from app.models.customer import Customer
 from app.services.mock_data import create_mock_data
-from app.services.rfm import run_rfm_analysis
-from app.services.recommendation import run_recommendation_engine
+from app.core.config import settings
+from app.services.generations import active_generation
+from app.services.ingest import ingest_orders
+from app.services.rfm import (
+    SCORE_TILES, SKETCHES_KEY, new_sketches, run_rfm_analysis, sketch_values, update_sketches
+)
+from app.services.sketch import load_sketches
+from app.services.state import get_state
+from app.services.recommendation import (
+    run_recommendation_engine, load_inputs,
+    compute_recommendations_loop, compute_recommendations_vectorized
+)
+from datetime import date
+import json
+import uuid
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
 import sys
 import os
 
@@ -31,8 +47,40 @@ def verify():
     run_rfm_analysis()
     run_recommendation_engine()
     
-    # 4. Check Output
-    print("[4] Checking Recommendations...")
+    # 4. Engine parity: vectorized rules must match the reference loop
+    print("[4] Comparing recommendation engines...")
+    with Session(engine) as session:
+        profiles, products = load_inputs(session)
+    today = date.today()
+    loop_recs = compute_recommendations_loop(profiles, products, today)
+    vector_recs = compute_recommendations_vectorized(profiles, products, today)
+    assert loop_recs.equals(vector_recs), "Vectorized engine output differs from loop engine"
+    print(f"    -> Both engines produced {len(loop_recs)} identical rows")
+
+    # 5. RFM engine parity: the SQL pushdown engine must match pandas
+    print("[5] Comparing RFM engines...")
+    results = {}
+    configured = settings.RFM_ENGINE
+    for rfm_engine in ("pandas", "sql"):
+        settings.RFM_ENGINE = rfm_engine
+        run_rfm_analysis(full_rebuild=True)
+        with Session(engine) as session:
+            results[rfm_engine] = pd.read_sql(
+                text("SELECT customer_id, product_id, recency_days, frequency, monetary, rfm_score, segment, "
+                     "last_purchase_date, expected_repurchase_date FROM rfmprofile "
+                     "WHERE generation = :g ORDER BY id"),
+                session.connection(), params={"g": active_generation(session, "rfmprofile")}
+            )
+    settings.RFM_ENGINE = configured
+    pd.testing.assert_frame_equal(results["pandas"], results["sql"])
+    print(f"    -> Both engines produced {len(results['sql'])} identical profiles")
+
+    # 6. Quintile sketches: bounded error, exact merges and incremental updates
+    print("[6] Checking RFM quintile sketches...")
+    check_sketches()
+
+    # 7. Check Output
+    print("[7] Checking Recommendations...")
     with Session(engine) as session:
         recs = session.exec(select(Recommendation).limit(5)).all()
         print(f"    -> Total Recommendations generated: {len(session.exec(select(Recommendation)).all())}")
@@ -42,5 +90,68 @@ def verify():
 
     print("=== Verification Complete ===")
 
+def published_profiles() -> pd.DataFrame:
+    with Session(engine) as session:
+        return pd.read_sql(
+            text("SELECT last_purchase_date, frequency, monetary FROM rfmprofile WHERE generation = :g"),
+            session.connection(), params={"g": active_generation(session, "rfmprofile")}
+        )
+
+def persisted_sketches() -> dict:
+    with Session(engine) as session:
+        sketches = load_sketches(get_state(session, SKETCHES_KEY))
+    return {name: sketch.to_dict() for name, sketch in sketches.items()}
+
+def check_sketches():
+    run_rfm_analysis(full_rebuild=True)
+    profiles = published_profiles()
+    sketches = update_sketches(new_sketches(), profiles)
+    assert persisted_sketches() == {name: sketch.to_dict() for name, sketch in sketches.items()}, \
+        "Persisted sketches differ from the published profiles"
+
+    # Cut points against the exact quintiles: recency and frequency must
+    # match, monetary must be within RFM_SKETCH_ACCURACY (relative).
+    for name, values in sketch_values(profiles).items():
+        ordered = np.sort(values)
+        n = len(ordered)
+        exact = [float(ordered[-(-k * n // SCORE_TILES) - 1]) for k in range(1, SCORE_TILES)]
+        estimate = sketches[name].quantiles(SCORE_TILES)
+        error = max(abs(e - x) / abs(x) if x else abs(e) for e, x in zip(estimate, exact))
+        bound = settings.RFM_SKETCH_ACCURACY if sketches[name].relative_accuracy else 0.0
+        assert error <= bound + 1e-12, f"{name} quintiles off by {error:.4%} (bound {bound:.2%})"
+        print(f"    -> {name} quintiles {[round(x, 2) for x in exact]}, max relative error {error:.4%}")
+
+    # Sketches of two halves, merged, equal the sketch of the whole.
+    half = len(profiles) // 2
+    merged = update_sketches(new_sketches(), profiles.iloc[:half])
+    for name, part in update_sketches(new_sketches(), profiles.iloc[half:]).items():
+        merged[name].merge(part)
+    assert all(merged[name].to_dict() == sketches[name].to_dict() for name in sketches), "Merged sketches differ"
+    print("    -> Merged half sketches equal the full sketch")
+
+    # An incremental run (old profiles of the touched pairs removed, new ones
+    # added) must leave the same sketches as a full rebuild. Order ids are new
+    # on every run so the orders are really inserted. The same checks run
+    # against a throwaway DB in tests/test_sketch.py.
+    with Session(engine) as session:
+        pairs = session.execute(text(
+            'SELECT o.customer_id, oi.product_id FROM orderitem oi JOIN "order" o ON oi.order_id = o.order_id '
+            'ORDER BY oi.id LIMIT 20'
+        )).all()
+    today = date.today().isoformat()
+    run_id = uuid.uuid4().hex[:8]
+    upload = "\n".join(
+        json.dumps({"order_id": f"VERIFY-{run_id}-{i}", "customer_id": customer_id, "order_date": today,
+                    "line_items": [{"product_id": product_id, "quantity": 1 + i % 3}]})
+        for i, (customer_id, product_id) in enumerate(pairs)
+    )
+    stats = ingest_orders([upload.encode()], "ndjson")
+    assert pairs and stats.inserted == len(pairs), f"Expected {len(pairs)} new orders, inserted {stats.inserted}"
+    run_rfm_analysis()
+    incremental = persisted_sketches()
+    run_rfm_analysis(full_rebuild=True)
+    assert incremental == persisted_sketches(), "Incremental sketches differ from a full rebuild"
+    print(f"    -> Incremental update over {len(pairs)} touched pairs equals the full rebuild sketches")
+
 if __name__ == "__main__":
     verify()